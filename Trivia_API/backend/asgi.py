@@ -0,0 +1,30 @@
+"""
+ASGI entry point, for ASGI servers (e.g. uvicorn) in front of the WSGI app.
+
+    uvicorn asgi:app
+
+Requests still run synchronously, in a thread pool; the app and its caches
+come from wsgi.py.
+
+With ASYNC_MODE=1 the quiz and listing endpoints are served by the async
+app instead (flaskr.async_app), which also needs the packages of
+requirements-async.txt (`quart`, `asyncpg` and SQLAlchemy's asyncio
+extension):
+
+    ASYNC_MODE=1 uvicorn asgi:app
+"""
+
+import os
+
+from asgiref.wsgi import WsgiToAsgi
+
+from flaskr.warmup import warm_up
+from wsgi import app as wsgi_app
+
+app = WsgiToAsgi(wsgi_app)
+warm_up(wsgi_app, caches=False)
+
+if os.getenv('ASYNC_MODE', '').lower() in ('1', 'true', 'yes'):
+    from flaskr.async_app import create_asgi_app, create_async_app
+
+    app = create_asgi_app(app, create_async_app(metrics=wsgi_app.extensions.get('metrics')))
@@ -0,0 +1,59 @@
+"""
+Throughput of importing questions.
+
+Compares one POST /questions per question with POST /questions/bulk, as a
+JSON array and as an NDJSON stream, for a few batch sizes.
+
+    python benchmarks/bench_bulk.py --sizes 5000 50000
+"""
+
+import json
+import time
+
+from common import make_app, parse_args, seed
+
+
+def records(size):
+    return [
+        {'question': f'Imported question {i}?', 'answer': f'answer {i}', 'category': i % 6 + 1, 'difficulty': i % 5 + 1}
+        for i in range(size)
+    ]
+
+
+def report(size, label, seconds):
+    print(f'{size:>8} questions  {label:<28} {seconds * 1000:10.0f} ms   {size / seconds:10.0f} questions/s')
+
+
+def main():
+    args = parse_args(__doc__, [5000, 50000])
+
+    for size in args.sizes:
+        questions = records(size)
+
+        # One request per question is slow; time a sample and extrapolate on big packs.
+        sample = questions[:min(size, 2000)]
+        app = make_app(args.database_uri)
+        seed(app, 0)
+        client = app.test_client()
+        start = time.perf_counter()
+        for question in sample:
+            client.post('/questions', json=question)
+        report(size, 'POST /questions (one by one)', (time.perf_counter() - start) * size / len(sample))
+
+        for batch_size in (100, 1000, 5000):
+            for label, kwargs in (
+                ('json', {'json': questions}),
+                ('ndjson', {'data': '\n'.join(json.dumps(q) for q in questions), 'content_type': 'application/x-ndjson'}),
+            ):
+                app = make_app(args.database_uri)
+                app.config['BULK_INSERT_BATCH_SIZE'] = batch_size
+                seed(app, 0)
+                client = app.test_client()
+                start = time.perf_counter()
+                response = client.post('/questions/bulk', **kwargs)
+                assert response.get_json()['created'] == size
+                report(size, f'bulk {label}, batches of {batch_size}', time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+CPU cost of turning a page of questions into a JSON response.
+
+Compares, for pages of each size:
+
+- orm + stdlib: Question instances, format(), Flask's default jsonify (the
+  path every listing used to take)
+- orm + orjson: the same objects through the orjson provider
+- rows + orjson: the question columns as tuples (flaskr.rows), zipped into
+  dicts and serialized by orjson
+
+and, on their own, the serialization of an already built page by each
+provider.
+
+The --sizes are page sizes; the bank holds as many questions as the largest.
+
+    python benchmarks/bench_json.py --sizes 10 100 1000
+"""
+
+from flask.json.provider import DefaultJSONProvider
+
+from common import make_app, parse_args, seed, summarize, timed
+from flaskr.json_provider import OrjsonProvider
+from flaskr.rows import format_row, select_questions
+from models import db, Question
+
+
+def main():
+    args = parse_args(__doc__, [10, 100, 1000])
+    app = make_app(args.database_uri)
+    seed(app, max(args.sizes))
+    providers = {'stdlib': DefaultJSONProvider(app), 'orjson': OrjsonProvider(app)}
+
+    def orm(provider, size):
+        questions = Question.query.order_by(Question.id).limit(size).all()
+        response = providers[provider].response({'questions': [question.format() for question in questions]})
+        db.session.expunge_all()
+        return response
+
+    def rows(size):
+        result = db.session.execute(select_questions().order_by(Question.id).limit(size))
+        return providers['orjson'].response({'questions': [format_row(row) for row in result]})
+
+    with app.test_request_context():
+        for size in args.sizes:
+            paths = (
+                ('orm + stdlib', lambda: orm('stdlib', size)),
+                ('orm + orjson', lambda: orm('orjson', size)),
+                ('rows + orjson', lambda: rows(size)),
+            )
+            for label, path in paths:
+                print(f'{size:>6} per page  {label:<14} {summarize(timed(path, args.iterations))}')
+
+            page = {'questions': [question.format() for question in Question.query.limit(size)]}
+            for name, provider in providers.items():
+                samples = timed(lambda: provider.response(page), args.iterations)
+                print(f'{size:>6} per page  {"dump " + name:<14} {summarize(samples)}')
+
+
+if __name__ == '__main__':
+    main()
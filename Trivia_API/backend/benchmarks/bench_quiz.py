@@ -0,0 +1,59 @@
+"""
+Latency of picking the next quiz question.
+
+Compares the old strategy (load every eligible row, filter in Python,
+random.choice) with the id-range sampling in the database and with the
+in-memory id index of flaskr.quiz, whose build time and size are reported.
+
+    python benchmarks/bench_quiz.py --sizes 1000 100000 1000000
+"""
+
+import random
+import time
+
+from common import make_app, parse_args, seed, summarize, timed
+from flaskr.quiz import QuestionIdIndex, pick_question, pick_random_question
+from models import Question
+
+
+def load_all(category_id, previous_questions):
+    if category_id == 0:
+        questions = Question.query.all()
+    else:
+        questions = Question.query.filter_by(category=category_id).all()
+    questions = [question for question in questions if question.id not in previous_questions]
+    return random.choice(questions) if questions else None
+
+
+def main():
+    args = parse_args(__doc__, [1000, 100000, 1000000])
+    app = make_app(args.database_uri)
+
+    for size in args.sizes:
+        seed(app, size)
+        previous_questions = random.sample(range(1, size + 1), min(size, 5))
+        # The old path hydrates the whole table; keep it to a handful of runs on big banks.
+        legacy_iterations = args.iterations if size <= 100000 else max(5, args.iterations // 40)
+
+        with app.app_context():
+            index = QuestionIdIndex()
+            app.extensions['question_id_index'] = index
+            start = time.perf_counter()
+            index.build()
+            print(f'{size:>8} rows  id index built in {(time.perf_counter() - start) * 1000:.0f} ms, '
+                  f'{index.nbytes() / 1024 / 1024:.1f} MiB of ids')
+
+            for category_id in (0, 1):
+                label = 'all' if category_id == 0 else f'category {category_id}'
+                old = timed(lambda: load_all(category_id, previous_questions), legacy_iterations)
+                id_range = timed(lambda: pick_random_question(category_id, previous_questions), args.iterations)
+                sample = timed(lambda: index.sample(category_id, previous_questions), args.iterations)
+                indexed = timed(lambda: pick_question(category_id, previous_questions), args.iterations)
+                print(f'{size:>8} rows  {label:<11}  load all:           {summarize(old)}')
+                print(f'{size:>8} rows  {label:<11}  id range:           {summarize(id_range)}')
+                print(f'{size:>8} rows  {label:<11}  id index sample:    {summarize(sample)}')
+                print(f'{size:>8} rows  {label:<11}  id index + fetch:   {summarize(indexed)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Per-row cost of loading a page of questions as ORM objects vs. as rows.
+
+For each page size, times building the list of question dicts from
+Question instances (query + format(), the old read path) and from column
+rows (flaskr.rows: question_rows() + format_row()), and measures the peak
+memory allocated while doing it with tracemalloc. The --sizes are page
+sizes; the bank holds ten times the largest.
+
+    python benchmarks/bench_rows.py --sizes 8 100 1000
+"""
+
+import statistics
+import tracemalloc
+
+from common import make_app, parse_args, seed, timed
+from flaskr.rows import format_row, question_rows
+from models import db, Question
+
+
+def orm_page(size):
+    questions = Question.query.order_by(Question.id).limit(size).all()
+    page = [question.format() for question in questions]
+    # Requests start with an empty session; don't let the identity map make later runs cheaper.
+    db.session.expunge_all()
+    return page
+
+
+def rows_page(size):
+    rows = question_rows(Question.query.order_by(Question.id)).limit(size).all()
+    return [format_row(row) for row in rows]
+
+
+def peak_kib(func):
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def main():
+    args = parse_args(__doc__, [8, 100, 1000])
+    app = make_app(args.database_uri)
+    seed(app, max(args.sizes) * 10)
+
+    with app.app_context():
+        for size in args.sizes:
+            for label, page in (('orm + format()', orm_page), ('rows', rows_page)):
+                median = statistics.median(timed(lambda: page(size), args.iterations))
+                peak = peak_kib(lambda: page(size))
+                print(f'{size:>6} per page  {label:<15} {median:8.3f} ms/page  {median * 1000 / size:7.2f} us/row'
+                      f'  {peak:9.1f} KiB peak  {peak * 1024 / size:8.0f} B/row')
+
+
+if __name__ == '__main__':
+    main()
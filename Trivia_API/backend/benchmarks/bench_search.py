@@ -0,0 +1,47 @@
+"""
+Latency of POST /questions/search backends.
+
+Compares the ILIKE substring scan with the indexed backend: the in-memory
+inverted index on SQLite, the GIN full-text index on Postgres. Also times
+the in-memory suggestions behind GET /questions/suggest.
+
+    python benchmarks/bench_search.py --sizes 10000 100000 1000000
+    python benchmarks/bench_search.py --database-uri postgresql://...
+"""
+
+import time
+
+from common import make_app, parse_args, seed, summarize, timed
+from flaskr.search import InvertedIndex, get_index, search
+from models import db
+
+TERMS = ['synthetic question', 'geography', 'number 4242', 'missing word']
+PARTIAL_TERMS = ['sy', 'synthetic question numb', 'geo', 'number 42']
+
+
+def main():
+    args = parse_args(__doc__, [10000, 100000, 1000000])
+    app = make_app(args.database_uri)
+
+    for size in args.sizes:
+        seed(app, size)
+        with app.test_request_context('/questions/search'):
+            indexed = 'fulltext' if db.engine.dialect.name == 'postgresql' else 'memory'
+            index = get_index()
+            start = time.perf_counter()
+            index.build()
+            print(f'{size:>8} rows  memory index built in {(time.perf_counter() - start) * 1000:.0f} ms')
+
+            iterations = args.iterations if size <= 100000 else max(10, args.iterations // 10)
+            for term in TERMS:
+                for backend in ('like', indexed):
+                    samples = timed(lambda: search(term, backend=backend), iterations)
+                    print(f'{size:>8} rows  {term!r:<22} {backend:<9} {summarize(samples)}')
+            for term in PARTIAL_TERMS:
+                samples = timed(lambda: index.suggest(term, limit=10), args.iterations)
+                print(f'{size:>8} rows  {term!r:<22} suggest   {summarize(samples)}')
+        app.extensions['search_index'] = InvertedIndex()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Cold start of the app, as seen by a new worker process.
+
+Every iteration builds a new app (and so a new engine and connection pool)
+against an already migrated database. The app used to run db.create_all()
+on every start, which connects and queries the catalog for each table; it
+now runs no SQL at all until the first request.
+
+    python benchmarks/bench_startup.py --database-uri postgresql://.../trivia
+"""
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from common import make_app, parse_args, seed, summarize, timed
+from flaskr import create_app
+from models import db
+
+statements = []
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+
+
+def main():
+    args = parse_args(__doc__, [1000])
+    app = make_app(args.database_uri)
+    config = {'SQLALCHEMY_DATABASE_URI': app.config['SQLALCHEMY_DATABASE_URI']}
+
+    def start(create_all):
+        new_app = create_app(config)
+        if create_all:
+            with new_app.app_context():
+                db.create_all()
+        with new_app.app_context():
+            db.engine.dispose()
+
+    for size in args.sizes:
+        seed(app, size)
+        for label, create_all in (('no DDL', False), ('create_all (before)', True)):
+            statements.clear()
+            start(create_all)
+            count = len(statements)
+            samples = timed(lambda: start(create_all), args.iterations)
+            print(f'{size:>8} rows  {label:<20} {summarize(samples)}   {count} SQL statements')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Worker boot: time until a worker is ready, and latency of its first requests.
+
+Three ways to start a worker process, each simulated with os.fork():
+
+- cold: the worker creates the app and serves at once; its first requests
+  build the caches they need (the category registry, the counts, the
+  search index, the quiz id index).
+- warm: the worker creates the app and runs flaskr.warmup.warm_up() before
+  serving (gunicorn without preload_app).
+- preload: the master created the app and warmed its caches once before
+  forking; the worker only swaps the inherited connections for its own
+  (gunicorn with preload_app, see gunicorn.conf.py).
+
+The first requests are GET /questions, POST /quizzes and a suggestion.
+
+    python benchmarks/bench_warmup.py --sizes 10000 100000
+"""
+
+import json
+import os
+import statistics
+import time
+
+from common import make_app, parse_args, seed
+from flaskr import create_app
+from flaskr.warmup import prime_pools, reset_pools, warm_up
+
+
+def first_requests(app):
+    client = app.test_client()
+    start = time.perf_counter()
+    client.get('/questions?page=1')
+    client.post('/quizzes', json={'previous_questions': [], 'quiz_category': {'id': 1, 'type': 'Science'}})
+    client.get('/questions/suggest?q=synth')
+    return time.perf_counter() - start
+
+
+def boot(mode, config, master_app):
+    """Forks a worker booting in `mode`; returns (seconds until ready, seconds of the first requests)."""
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        start = time.perf_counter()
+        if mode == 'preload':
+            app = master_app
+            with app.app_context():
+                reset_pools()
+                prime_pools()
+        else:
+            app = create_app(config)
+            if mode == 'warm':
+                warm_up(app)
+        ready = time.perf_counter() - start
+        os.write(write_end, json.dumps([ready, first_requests(app)]).encode('ascii'))
+        os._exit(0)
+
+    os.close(write_end)
+    with os.fdopen(read_end) as pipe:
+        result = json.loads(pipe.read())
+    os.waitpid(pid, 0)
+    return result
+
+
+def main():
+    args = parse_args(__doc__, [10000, 100000])
+    app = make_app(args.database_uri)
+    config = {'SQLALCHEMY_DATABASE_URI': app.config['SQLALCHEMY_DATABASE_URI']}
+    iterations = min(args.iterations, 20)
+
+    for size in args.sizes:
+        seed(app, size)
+        master_app = create_app(config)
+        start = time.perf_counter()
+        warm_up(master_app, pools=False)
+        print(f'{size:>8} rows  master warmup (once, before forking): {(time.perf_counter() - start) * 1000:9.1f} ms')
+
+        for mode in ('cold', 'warm', 'preload'):
+            results = [boot(mode, config, master_app) for _ in range(iterations)]
+            ready = statistics.median(result[0] for result in results) * 1000
+            first = statistics.median(result[1] for result in results) * 1000
+            print(f'{size:>8} rows  {mode:<8} ready after {ready:9.1f} ms   first requests {first:9.1f} ms'
+                  f'   total {ready + first:9.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Shared helpers for the benchmark scripts.
+
+The benchmarks run against a throwaway SQLite database by default so they
+can be executed anywhere; pass --database-uri to point them at Postgres.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flaskr import create_app  # noqa: E402
+from models import db, Question, Category  # noqa: E402
+
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+
+
+def parse_args(description, default_sizes):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--sizes', type=int, nargs='+', default=default_sizes,
+                        help='question bank sizes to benchmark')
+    parser.add_argument('--iterations', type=int, default=200,
+                        help='timed iterations per size')
+    parser.add_argument('--database-uri', default=None,
+                        help='database to use instead of a temporary SQLite file')
+    return parser.parse_args()
+
+
+def make_app(database_uri=None):
+    if database_uri is None:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_uri = f'sqlite:///{path}'
+    # The tables only exist once seed() has run; the benchmarks build the indexes they need.
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_uri, 'TESTING': True})
+    return app
+
+
+def seed(app, size, batch_size=50000):
+    """Recreates the tables and fills them with `size` synthetic questions."""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(Category.__table__.insert(), [{'type': name} for name in CATEGORIES])
+        rows = []
+        for i in range(size):
+            rows.append({
+                'question': f'Synthetic question number {i} about {random.choice(CATEGORIES).lower()}?',
+                'answer': f'answer {i}',
+                'category': i % len(CATEGORIES) + 1,
+                'difficulty': i % 5 + 1,
+            })
+            if len(rows) == batch_size:
+                db.session.execute(Question.__table__.insert(), rows)
+                rows = []
+        if rows:
+            db.session.execute(Question.__table__.insert(), rows)
+        db.session.commit()
+
+
+def timed(func, iterations):
+    """Calls func `iterations` times and returns the samples in milliseconds."""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    return f'p50 {statistics.median(ordered):9.3f} ms   p99 {p99:9.3f} ms'
@@ -0,0 +1,136 @@
+"""
+Load test of a running server: throughput and p50/p99 latency at several
+levels of concurrency, for comparing the sync and the async serving modes.
+
+Each simulated client keeps one connection open and sends, in a loop,
+GET /categories, GET /questions?page=N, GET /categories/<id>/questions and
+POST /quizzes, the way the frontend does. Start the server in each mode
+against the same database, then point the script at it:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --concurrency 10 100 500
+
+    ASYNC_MODE=1 uvicorn --workers 4 --port 8000 asgi:app
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --concurrency 10 100 500
+
+Only the standard library is used (HTTP/1.1 over asyncio streams).
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='base URL of the server')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 200],
+                        help='numbers of concurrent clients')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per concurrency level')
+    parser.add_argument('--pages', type=int, default=10, help='pages of questions to spread the listings over')
+    parser.add_argument('--categories', type=int, default=6, help='number of categories')
+    return parser.parse_args()
+
+
+def next_request(args):
+    """(method, path, body) of a random request of the frontend mix."""
+    roll = random.random()
+    if roll < 0.2:
+        return 'GET', '/categories', None
+    if roll < 0.5:
+        return 'GET', f'/questions?page={random.randint(1, args.pages)}', None
+    if roll < 0.7:
+        return 'GET', f'/categories/{random.randint(1, args.categories)}/questions', None
+    category = random.randint(0, args.categories)
+    body = {'previous_questions': [], 'quiz_category': {'id': category, 'type': 'click' if category == 0 else ''}}
+    return 'POST', '/quizzes', json.dumps(body).encode('utf-8')
+
+
+async def send(reader, writer, host, method, path, body):
+    """Sends one request on the connection; returns (status code, whether the server keeps the connection open)."""
+    head = f'{method} {path} HTTP/1.1\r\nHost: {host}\r\n'
+    if body is not None:
+        head += f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+    writer.write(head.encode('ascii') + b'\r\n' + (body or b''))
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed by the server')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def client(args, url, deadline, latencies, errors):
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+            method, path, body = next_request(args)
+            start = time.perf_counter()
+            status, keep_alive = await send(reader, writer, url.netloc, method, path, body)
+            latencies.append(time.perf_counter() - start)
+            if status >= 500:
+                errors.append(status)
+            if not keep_alive:
+                writer.close()
+                reader = writer = None
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            errors.append(type(e).__name__)
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_level(args, url, concurrency):
+    latencies, errors = [], []
+    start = time.perf_counter()
+    deadline = start + args.duration
+    await asyncio.gather(*(client(args, url, deadline, latencies, errors) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def report(concurrency, latencies, errors, elapsed):
+    if len(latencies) < 2:
+        print(f'{concurrency:>6} clients: {len(latencies)} responses, {len(errors)} errors')
+        return
+    cuts = statistics.quantiles(latencies, n=100)
+    print(f'{concurrency:>6} clients: {len(latencies) / elapsed:>9.0f} req/s'
+          f'  p50 {cuts[49] * 1000:>8.2f} ms  p99 {cuts[98] * 1000:>8.2f} ms  {len(errors)} errors')
+
+
+def main():
+    args = parse_args()
+    url = urlsplit(args.url)
+    print(f'{args.url}, {args.duration:g}s per level')
+    for concurrency in args.concurrency:
+        latencies, errors, elapsed = asyncio.run(run_level(args, url, concurrency))
+        report(concurrency, latencies, errors, elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,62 @@
 from flask import Flask, request, abort, jsonify
 from flask_cors import CORS
-import random
-
-from models import setup_db, Question, Category, db
-
-QUESTIONS_PER_PAGE = 8
+from flask_migrate import Migrate
+
+from models import setup_db, Question, db
+from .bulk import delete_questions, import_questions
+from .categories import get_registry, init_app as init_categories
+from .counts import get_counts, init_app as init_counts
+from .export import export_response
+from .json_provider import init_app as init_json
+from .metrics import export as export_metrics, init_app as init_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .pagination import QUESTIONS_PER_PAGE, paginate
+from .pool import pools
+from .quiz import init_app as init_quiz, pick_question
+from .quiz_sessions import init_app as init_quiz_sessions, next_question, start_session
+from .replicas import init_app as init_replicas, read_only
+from .response_cache import cached, init_app as init_response_cache
+from .rows import format_row, question_rows
+from .timing import init_app as init_timing
+from .versions import CATEGORIES, QUESTIONS, conditional
+from .search import get_index, init_app as init_search, search
+from .slow_queries import init_app as init_slow_queries
+
+SUGGESTIONS_LIMIT = 10
+MAX_SUGGESTIONS_LIMIT = 50
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
+    app.config['QUESTIONS_PER_PAGE'] = QUESTIONS_PER_PAGE
 
     if test_config is None:
         setup_db(app)
     else:
+        app.config.from_mapping(test_config)
         database_path = test_config.get('SQLALCHEMY_DATABASE_URI')
         setup_db(app, database_path=database_path)
 
+    init_json(app)
+    init_timing(app)
+    init_metrics(app)
+
     CORS(app, resources={r"/*": {"origins": "*"}})
     """
     Yes@TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
     """
     
-    with app.app_context():
-        db.create_all()
+    # The schema is managed by the migrations (`flask db upgrade`); starting
+    # the app runs no DDL and no catalog queries.
+    Migrate(app, db)
+
+    init_categories(app)
+    init_counts(app)
+    init_search(app)
+    init_quiz(app)
+    init_quiz_sessions(app)
+    init_replicas(app)
+    init_response_cache(app)
+    init_slow_queries(app)
 
     """
     Yes@TODO: Use the after_request decorator to set Access-Control-Allow
@@ -41,11 +75,13 @@ def create_app(test_config=None):
     """
 
     @app.route('/categories', methods=['GET'])
+    @read_only
+    @conditional(CATEGORIES)
     def get_categories():
 
         try:
-            categories = Category.query.all()
-            formatted_categories = {category.id: category.type for category in categories}
+            formatted_categories = get_registry().categories()
+
             return jsonify({
                 'success': True,
                 'categories': formatted_categories
@@ -70,31 +106,25 @@ def create_app(test_config=None):
     """
 
     @app.route('/questions', methods=['GET'])
-    
+    @read_only
+    @conditional(QUESTIONS, CATEGORIES)
+    @cached
     def get_questions():
         try:
 
-            page = request.args.get('page', 1, type=int)
-            pagination = Question.query.paginate(page=page, per_page=QUESTIONS_PER_PAGE, error_out=False)
-            questions=[question.format() for question in pagination.items]
+            pagination = paginate(question_rows(Question.query.order_by(Question.id)), total=get_counts().total())
+            questions = [format_row(row) for row in pagination.items]
             total_questions = pagination.total
-            #start = (page - 1) * QUESTIONS_PER_PAGE
-            #end = start + QUESTIONS_PER_PAGE
-
-
-            #questions = Question.query.all()
-            #formatted_questions = [question.format() for question in questions] 
-            #total_questions = len(formatted_questions)
 
             if total_questions == 0:
                 abort(404)
 
-            categories = Category.query.all()
-            formatted_categories = {category.id: category.type for category in categories}
+            formatted_categories = get_registry().categories()
 
             return jsonify({
                 'success': True,
                 'questions': questions,
+                'next_cursor': pagination.next_cursor,
                 'total_questions': total_questions,
                 'categories': formatted_categories,
                 'current_category': None
@@ -130,6 +160,31 @@ def create_app(test_config=None):
             db.session.rollback()
             abort(422)
 
+    """
+    Batch delete: every question matching a list of ids and/or a category and
+    difficulty, in a single statement and transaction.
+    """
+    @app.route('/questions', methods=['DELETE'])
+    def delete_questions_in_batch():
+        try:
+            body = request.get_json()
+            deleted = delete_questions(
+                ids=body.get('ids'),
+                category=body.get('category'),
+                difficulty=body.get('difficulty')
+            )
+
+            return jsonify({
+                'success': True,
+                'deleted': deleted,
+                'total_deleted': len(deleted)
+            }), 200
+
+        except Exception as e:
+            print(e)
+            db.session.rollback()
+            abort(422)
+
     """
     Yes@TODO:
     Create an endpoint to POST a new question,
@@ -146,7 +201,7 @@ def create_app(test_config=None):
             body = request.get_json()
             question= body.get('question')
             answer= body.get('answer')
-            category= body.get('category')
+            category= int(body.get('category'))
             difficulty= body.get('difficulty')
 
             new_question = Question(
@@ -165,6 +220,37 @@ def create_app(test_config=None):
             db.session.rollback()
             abort(422)
     """
+    Bulk import: a JSON array or an NDJSON stream of questions, validated one
+    by one and inserted in batches. Returns the outcome of every record,
+    with a 422 when none of them could be inserted.
+    """
+    @app.route('/questions/bulk', methods=['POST'])
+    def import_questions_in_bulk():
+        try:
+            results = import_questions()
+            created = sum(1 for result in results if 'created' in result)
+
+            if not created:
+                return jsonify({
+                    'success': False,
+                    'error': 422,
+                    'message': 'Unprocessable entity',
+                    'created': 0,
+                    'failed': len(results),
+                    'results': results
+                }), 422
+
+            return jsonify({
+                'success': True,
+                'created': created,
+                'failed': len(results) - created,
+                'results': results
+            }), 201
+        except Exception as e:
+            print(e)
+            db.session.rollback()
+            abort(422)
+    """
     Yes@TODO: ###Combined with the one above.##$
     Create a POST endpoint to get questions based on a search term.
     It should return any questions for whom the search term
@@ -175,19 +261,21 @@ def create_app(test_config=None):
     Try using the word "title" to start.
     """
     @app.route('/questions/search', methods=['POST'])
+    @read_only
     def search_questions():
         try:
             body= request.get_json()
             search_term = body.get('searchTerm', None)
             if search_term is None:
                 abort(422)
-            questions = Question.query.filter(Question.question.ilike(f'%{search_term}%')).all()
-            formatted_questions = [question.format() for question in questions]
+            pagination = search(search_term)
+            formatted_questions = [format_row(row) for row in pagination.items]
 
             return jsonify({
                 'success': True,
                 'questions': formatted_questions,
-                'total_questions': len(formatted_questions),
+                'next_cursor': pagination.next_cursor,
+                'total_questions': pagination.total,
                 'current_category': None
             }), 200 
 
@@ -196,6 +284,40 @@ def create_app(test_config=None):
             db.session.rollback()
             abort(422)
     """
+    Export of the whole question bank, streamed as NDJSON or CSV.
+    """
+    @app.route('/questions/export', methods=['GET'])
+    @read_only
+    def export_questions():
+        try:
+            return export_response(request.args.get('format', 'ndjson'))
+        except Exception as e:
+            print(e)
+            db.session.rollback()
+            abort(422)
+
+    """
+    Search-as-you-type: the questions whose words start with the typed text,
+    answered from the in-memory word index without touching the database.
+    """
+    @app.route('/questions/suggest', methods=['GET'])
+    @read_only
+    def suggest_questions():
+        try:
+            text = request.args.get('q', '')
+            limit = min(max(request.args.get('limit', SUGGESTIONS_LIMIT, type=int), 1), MAX_SUGGESTIONS_LIMIT)
+            suggestions = get_index().suggest(text, limit=limit)
+
+            return jsonify({
+                'success': True,
+                'suggestions': [{'id': question_id, 'question': question} for question_id, question in suggestions]
+            }), 200
+
+        except Exception as e:
+            print(e)
+            db.session.rollback()
+            abort(422)
+    """
     Yes@TODO:
     Create a GET endpoint to get questions based on category.
 
@@ -204,25 +326,27 @@ def create_app(test_config=None):
     category to be shown.
     """
     @app.route('/categories/<int:category_id>/questions', methods=['GET'])
+    @read_only
+    @conditional(QUESTIONS, CATEGORIES)
+    @cached
     def get_questions_by_category(category_id):
         try:
-            page = request.args.get('page', 1, type=int)
-            start = (page - 1) * QUESTIONS_PER_PAGE
-            end = start + QUESTIONS_PER_PAGE
-
-            questions = Question.query.filter_by(category=category_id).all()
-            formatted_questions = [question.format() for question in questions]
-            total_questions = len(formatted_questions)
+            pagination = paginate(
+                question_rows(Question.query.filter_by(category=category_id).order_by(Question.id)),
+                total=get_counts().category(category_id)
+            )
+            formatted_questions = [format_row(row) for row in pagination.items]
+            total_questions = pagination.total
 
             if total_questions == 0:
                 abort(404)
 
-            categories = Category.query.all()
-            formatted_categories = {category.id: category.type for category in categories}
+            formatted_categories = get_registry().categories()
 
             return jsonify({
                 'success': True,
-                'questions': formatted_questions[start:end],
+                'questions': formatted_questions,
+                'next_cursor': pagination.next_cursor,
                 'total_questions': total_questions,
                 'categories': formatted_categories,
                 'current_category': category_id
@@ -245,6 +369,7 @@ def create_app(test_config=None):
     and shown whether they were correct or not.
     """
     @app.route('/quizzes', methods=['POST'])
+    @read_only
     def play_quiz():
         try:
             body = request.get_json()
@@ -254,24 +379,17 @@ def create_app(test_config=None):
             if quiz_category is None:
                 abort(422)
 
-            if quiz_category['id'] == 0:
-                questions = Question.query.all()
-            else:
-                questions = Question.query.filter_by(category=quiz_category['id']).all()
-
-            questions = [question for question in questions if question.id not in previous_questions]
+            question = pick_question(quiz_category['id'], previous_questions)
 
-            if len(questions) == 0:
+            if question is None:
                 return jsonify({
                     'success': True,
                     'question': None
                 }), 200
 
-            question = random.choice(questions).format()
-
             return jsonify({
                 'success': True,
-                'question': question,
+                'question': format_row(question),
                 'quiz_category': quiz_category
             }), 200
         except Exception as e:
@@ -279,6 +397,71 @@ def create_app(test_config=None):
             db.session.rollback()
             abort(422)
 
+    """
+    Quiz sessions: the server keeps the shuffled questions of the quiz, so
+    the client only sends the session id at each step.
+    """
+    @app.route('/quizzes/sessions', methods=['POST'])
+    @read_only
+    def create_quiz_session():
+        try:
+            body = request.get_json()
+            quiz_category = body.get('quiz_category', None)
+
+            if quiz_category is None:
+                abort(422)
+
+            session_id, total_questions = start_session(quiz_category['id'], body.get('max_questions'))
+
+            return jsonify({
+                'success': True,
+                'session_id': session_id,
+                'total_questions': total_questions,
+                'quiz_category': quiz_category
+            }), 201
+        except Exception as e:
+            print(e)
+            db.session.rollback()
+            abort(422)
+
+    @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+    @read_only
+    def next_quiz_question(session_id):
+        try:
+            question, remaining = next_question(session_id)
+        except KeyError:
+            abort(404)
+        except Exception as e:
+            print(e)
+            db.session.rollback()
+            abort(422)
+
+        return jsonify({
+            'success': True,
+            'question': format_row(question) if question is not None else None,
+            'remaining': remaining
+        }), 200
+
+    """
+    Connection pool metrics of this process: checked-out, idle and overflow
+    connections.
+    """
+    @app.route('/metrics/pool', methods=['GET'])
+    def get_pool_metrics():
+        return jsonify({
+            'success': True,
+            'pools': pools()
+        })
+
+    """
+    Metrics of every route in the Prometheus text format (see flaskr.metrics).
+    """
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        if 'metrics' not in app.extensions:
+            abort(404)
+        return app.response_class(export_metrics(), content_type=METRICS_CONTENT_TYPE)
+
     """
     @TODO:
     Create error handlers for all expected errors
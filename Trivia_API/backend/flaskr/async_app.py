@@ -0,0 +1,385 @@
+"""
+Async serving mode for the hot read endpoints.
+
+Every Flask view holds a worker thread for the whole database round trip,
+so spiky quiz traffic runs out of workers long before it runs out of CPU.
+In async mode (ASYNC_MODE, see asgi.py) an ASGI server runs
+
+- GET /categories
+- GET /questions
+- GET /categories/<id>/questions
+- POST /quizzes
+
+in a Quart app on an asyncio event loop, with SQLAlchemy's asyncio
+extension and the asyncpg driver: a request waiting on the database holds
+no thread, and one process serves many concurrent connections. Every other
+route (writes, search, sessions, metrics) still goes to the Flask app,
+wrapped as ASGI.
+
+The JSON (and status codes) are those of the Flask views. The categories
+and the question counts are cached in the process and reloaded when the
+matching row of table_versions changes, so writes made through the Flask
+app, or by any other process, are seen at once.
+
+The responses carry the same headers as the Flask app's: the ETag and
+Last-Modified of flaskr.versions (with the same 304s), the Cache-Control
+of the cached listings and the Server-Timing of flaskr.timing. Given the
+metrics registry of the Flask app, the requests are counted in it too
+(flaskr.metrics). Only the response cache itself is left out: the listings
+are built on each request.
+
+Needs `quart`, `asyncpg` (or `aiosqlite` for SQLite) and SQLAlchemy's
+asyncio extension (`greenlet`), all in requirements-async.txt.
+"""
+
+import asyncio
+import logging
+import random
+import re
+from contextlib import asynccontextmanager
+
+try:
+    from quart import Quart, abort, g, jsonify, request
+except ImportError as e:
+    raise ImportError('the async mode needs the packages of requirements-async.txt') from e
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.sansio.http import is_resource_modified
+
+from models import database_path, engine_options, get_statement_timeout, Category, Question, TableVersion
+from .pagination import cursor_args, decode_cursor, encode_cursor, is_cursor_request, page_args, QUESTIONS_PER_PAGE
+from .metrics import record_request
+from .response_cache import DEFAULT_MAX_AGE
+from .rows import format_row, select_questions
+from .timing import RequestTiming, report
+from .versions import CATEGORIES, QUESTIONS, make_etag, versions_of
+
+logger = logging.getLogger('flaskr.async_app')
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+# (method, path) served by the async app; the rest goes to the Flask app.
+ASYNC_ROUTES = (
+    ('GET', re.compile(r'/categories/?')),
+    ('GET', re.compile(r'/questions/?')),
+    ('GET', re.compile(r'/categories/\d+/questions/?')),
+    ('POST', re.compile(r'/quizzes/?')),
+)
+
+
+def async_database_uri(uri):
+    """The same database with the asyncio driver, e.g. postgresql:// -> postgresql+asyncpg://."""
+    url = make_url(uri)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+def async_engine_options(app, uri):
+    """The pool settings of models.engine_options; asyncpg takes the statement timeout as a server setting."""
+    options = engine_options(app, uri)
+    options.pop('connect_args', None)
+    statement_timeout = get_statement_timeout(app)
+    if statement_timeout and make_url(uri).get_backend_name() == 'postgresql':
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(statement_timeout)}}
+    return options
+
+
+class VersionedCache:
+    """A value derived from the database, reloaded when the version of its table changes."""
+
+    def __init__(self, load):
+        self.load = load
+        self.version = None
+        self.value = None
+        self._lock = asyncio.Lock()
+
+    async def get(self, connection, version):
+        if self.version != version or self.value is None:
+            async with self._lock:
+                if self.version != version or self.value is None:
+                    self.value = await self.load(connection)
+                    self.version = version
+        return self.value
+
+
+async def read_versions(connection):
+    """({table: version}, last modified datetime or None), like flaskr.versions.read_versions."""
+    rows = await connection.execute(select(TableVersion.name, TableVersion.version, TableVersion.updated_at))
+    return versions_of(rows.all())
+
+
+async def load_categories(connection):
+    rows = await connection.execute(select(Category.id, Category.type).order_by(Category.id))
+    return dict(rows.all())
+
+
+async def load_counts(connection):
+    rows = await connection.execute(select(Question.category, func.count(Question.id)).group_by(Question.category))
+    return dict(rows.all())
+
+
+async def pick_random_row(connection, category_id=None, previous_questions=None):
+    """The async counterpart of flaskr.quiz.pick_random_question: a random row by id range."""
+    low = (await connection.execute(select(func.min(Question.id)))).scalar()
+    high = (await connection.execute(select(func.max(Question.id)))).scalar()
+    if low is None:
+        return None
+
+    statement = select_questions()
+    if category_id:
+        statement = statement.where(Question.category == category_id)
+    if previous_questions:
+        statement = statement.where(Question.id.notin_(previous_questions))
+
+    pivot = random.randint(low, high)
+    row = (await connection.execute(statement.where(Question.id >= pivot).order_by(Question.id).limit(1))).first()
+    if row is None:
+        statement = statement.where(Question.id < pivot).order_by(Question.id.desc()).limit(1)
+        row = (await connection.execute(statement)).first()
+    return row
+
+
+def create_async_app(test_config=None, metrics=None):
+    """The async app; metrics is the Registry of the Flask app served alongside, if any."""
+    app = Quart(__name__)
+    app.config['QUESTIONS_PER_PAGE'] = QUESTIONS_PER_PAGE
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+    uri = app.config.setdefault('SQLALCHEMY_DATABASE_URI', database_path)
+
+    categories = VersionedCache(load_categories)
+    counts = VersionedCache(load_counts)
+    engines = {}
+
+    @app.before_serving
+    async def create_engine():
+        engines['db'] = create_async_engine(async_database_uri(uri), **async_engine_options(app, uri))
+
+    @app.after_serving
+    async def dispose_engine():
+        await engines.pop('db').dispose()
+
+    @app.before_request
+    async def start_timing():
+        g.timing = RequestTiming()
+
+    @app.after_request
+    async def after_request(response):
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, DELETE, OPTIONS'
+        timing = g.get('timing')
+        if timing is not None:
+            report(timing, request, response, app.config)
+        if metrics is not None:
+            record_request(metrics, request, response, timing)
+        return response
+
+    @asynccontextmanager
+    async def connect():
+        """A connection whose statements are counted in the timing of the request."""
+        async with engines['db'].connect() as connection:
+            # The info of the pooled DBAPI connection, read by flaskr.timing; it outlives this checkout.
+            info = (await connection.get_raw_connection()).info
+            info['timing'] = g.timing
+            try:
+                yield connection
+            finally:
+                info.pop('timing', None)
+
+    def is_fresh(etag, last_modified):
+        """Whether the client's copy is still current, like flaskr.versions.conditional."""
+        fresh = not is_resource_modified(
+            http_if_none_match=request.headers.get('If-None-Match'),
+            http_if_modified_since=request.headers.get('If-Modified-Since'),
+            etag=etag,
+            last_modified=last_modified,
+        )
+        if metrics is not None:
+            metrics.inc('trivia_cache_requests_total', cache='conditional', result='hit' if fresh else 'miss')
+        return fresh
+
+    def with_validators(response, etag, last_modified, public=False):
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        if public and app.config.get('RESPONSE_CACHE', 'memory'):
+            # As flaskr.response_cache.cached does for the listings.
+            response.cache_control.public = True
+            response.cache_control.max_age = app.config.get('RESPONSE_CACHE_MAX_AGE', DEFAULT_MAX_AGE)
+        return response
+
+    def not_modified(etag, last_modified):
+        return with_validators(app.response_class('', status=304), etag, last_modified)
+
+    async def questions_page(connection, statement):
+        """(rows, next cursor) of the requested page of statement, like flaskr.pagination.paginate."""
+        if is_cursor_request(request.args):
+            after, limit = cursor_args(request.args, app.config)
+            if after:
+                statement = statement.where(Question.id > decode_cursor(after))
+            rows = (await connection.execute(statement.order_by(Question.id).limit(limit + 1))).all()
+            next_cursor = encode_cursor(rows[limit - 1].id) if len(rows) > limit else None
+            return rows[:limit], next_cursor
+
+        page, per_page = page_args(request.args, app.config)
+        rows = await connection.execute(statement.order_by(Question.id).limit(per_page).offset((page - 1) * per_page))
+        return rows.all(), None
+
+    @app.route('/categories', methods=['GET'])
+    async def get_categories():
+        try:
+            async with connect() as connection:
+                versions, last_modified = await read_versions(connection)
+                etag = make_etag((CATEGORIES,), versions, request)
+                if is_fresh(etag, last_modified):
+                    return not_modified(etag, last_modified)
+                formatted_categories = await categories.get(connection, versions.get(CATEGORIES))
+
+            response = jsonify({
+                'success': True,
+                'categories': formatted_categories
+            })
+            return with_validators(response, etag, last_modified), 200
+        except Exception:
+            logger.exception('%s %s failed', request.method, request.path)
+            abort(422)
+
+    @app.route('/questions', methods=['GET'])
+    async def get_questions():
+        try:
+            async with connect() as connection:
+                versions, last_modified = await read_versions(connection)
+                etag = make_etag((QUESTIONS, CATEGORIES), versions, request)
+                if is_fresh(etag, last_modified):
+                    return not_modified(etag, last_modified)
+                total_questions = sum((await counts.get(connection, versions.get(QUESTIONS))).values())
+                rows, next_cursor = await questions_page(connection, select_questions())
+                formatted_categories = await categories.get(connection, versions.get(CATEGORIES))
+
+            if total_questions == 0:
+                abort(404)
+
+            response = jsonify({
+                'success': True,
+                'questions': [format_row(row) for row in rows],
+                'next_cursor': next_cursor,
+                'total_questions': total_questions,
+                'categories': formatted_categories,
+                'current_category': None
+            })
+            return with_validators(response, etag, last_modified, public=True), 200
+        except Exception:
+            logger.exception('%s %s failed', request.method, request.path)
+            abort(422)
+
+    @app.route('/categories/<int:category_id>/questions', methods=['GET'])
+    async def get_questions_by_category(category_id):
+        try:
+            async with connect() as connection:
+                versions, last_modified = await read_versions(connection)
+                etag = make_etag((QUESTIONS, CATEGORIES), versions, request)
+                if is_fresh(etag, last_modified):
+                    return not_modified(etag, last_modified)
+                total_questions = (await counts.get(connection, versions.get(QUESTIONS))).get(category_id, 0)
+                statement = select_questions().where(Question.category == category_id)
+                rows, next_cursor = await questions_page(connection, statement)
+                formatted_categories = await categories.get(connection, versions.get(CATEGORIES))
+
+            if total_questions == 0:
+                abort(404)
+
+            response = jsonify({
+                'success': True,
+                'questions': [format_row(row) for row in rows],
+                'next_cursor': next_cursor,
+                'total_questions': total_questions,
+                'categories': formatted_categories,
+                'current_category': category_id
+            })
+            return with_validators(response, etag, last_modified, public=True), 200
+        except Exception:
+            logger.exception('%s %s failed', request.method, request.path)
+            abort(422)
+
+    @app.route('/quizzes', methods=['POST'])
+    async def play_quiz():
+        try:
+            body = await request.get_json()
+            previous_questions = body.get('previous_questions', [])
+            quiz_category = body.get('quiz_category', None)
+
+            if quiz_category is None:
+                abort(422)
+
+            async with connect() as connection:
+                question = await pick_random_row(connection, quiz_category['id'], previous_questions)
+
+            if question is None:
+                return jsonify({
+                    'success': True,
+                    'question': None
+                }), 200
+
+            return jsonify({
+                'success': True,
+                'question': format_row(question),
+                'quiz_category': quiz_category
+            }), 200
+        except Exception:
+            logger.exception('%s %s failed', request.method, request.path)
+            abort(422)
+
+    @app.errorhandler(404)
+    async def not_found(error):
+        return jsonify({
+            'success': False,
+            'error': 404,
+            'message': 'Resource not found'
+        }), 404
+
+    @app.errorhandler(422)
+    async def unprocessable(error):
+        return jsonify({
+            'success': False,
+            'error': 422,
+            'message': 'Unprocessable entity'
+        }), 422
+
+    @app.errorhandler(500)
+    async def internal_server_error(error):
+        return jsonify({
+            'success': False,
+            'error': 500,
+            'message': 'Internal server error'
+        }), 500
+
+    @app.errorhandler(400)
+    async def bad_request(error):
+        return jsonify({
+            'success': False,
+            'error': 400,
+            'message': 'Bad request'
+        }), 400
+
+    return app
+
+
+def is_async_route(scope):
+    return scope['type'] == 'http' and any(
+        scope['method'] == method and pattern.fullmatch(scope['path'])
+        for method, pattern in ASYNC_ROUTES
+    )
+
+
+def create_asgi_app(sync_app, async_app):
+    """An ASGI app sending the ASYNC_ROUTES to async_app and everything else to sync_app (an ASGI app too)."""
+    async def app(scope, receive, send):
+        # The lifespan events start and stop the engine of the async app.
+        if scope['type'] == 'lifespan' or is_async_route(scope):
+            await async_app(scope, receive, send)
+        else:
+            await sync_app(scope, receive, send)
+    return app
@@ -0,0 +1,174 @@
+"""
+Bulk question writes.
+
+Import, for `POST /questions/bulk`:
+
+The body is either a JSON array of questions or, with an
+`application/x-ndjson` content type, one JSON question per line. NDJSON
+bodies are read line by line, so a large pack never has to be held in
+memory. Every record is validated on its own; the valid ones are inserted
+BULK_INSERT_BATCH_SIZE at a time with a single multi-row INSERT ... RETURNING
+and one commit per batch, instead of one transaction per question. A batch
+that fails is logged on the `flaskr.bulk` logger and its records reported
+as not inserted.
+
+Deletion, for `DELETE /questions`: questions selected by a list of ids
+and/or a category and difficulty filter are removed with a single
+DELETE ... RETURNING in one transaction.
+"""
+
+import io
+import json
+import logging
+
+from flask import current_app, request
+from sqlalchemy import delete, insert
+
+from models import db, Question
+from .categories import get_registry
+from .changes import DELETE, INSERT, record
+
+logger = logging.getLogger('flaskr.bulk')
+
+BATCH_SIZE = 1000
+NDJSON_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonlines')
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def read_records():
+    """Yields the question records of the request body (an InvalidRecord for a malformed NDJSON line)."""
+    if request.mimetype in NDJSON_TYPES:
+        stream = request.stream
+        if isinstance(stream, io.RawIOBase):
+            # A raw stream reads lines in tiny chunks; buffer it.
+            stream = io.BufferedReader(stream, buffer_size=64 * 1024)
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield InvalidRecord('malformed JSON')
+        return
+
+    body = request.get_json()
+    if not isinstance(body, list):
+        raise InvalidRecord('expected a JSON array of questions')
+    yield from body
+
+
+def validate(record, categories):
+    """Returns the column values of a record, raising InvalidRecord when it is not a valid question."""
+    if isinstance(record, InvalidRecord):
+        raise record
+    if not isinstance(record, dict):
+        raise InvalidRecord('expected a JSON object')
+
+    values = {}
+    for field in ('question', 'answer'):
+        value = record.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise InvalidRecord(f'{field} must be a non-empty string')
+        values[field] = value
+
+    try:
+        difficulty = int(record.get('difficulty'))
+    except (TypeError, ValueError):
+        raise InvalidRecord('difficulty must be an integer')
+    if not 1 <= difficulty <= 5:
+        raise InvalidRecord('difficulty must be between 1 and 5')
+    values['difficulty'] = difficulty
+
+    try:
+        category = int(record.get('category'))
+    except (TypeError, ValueError):
+        raise InvalidRecord('category must be an integer')
+    if category not in categories:
+        raise InvalidRecord(f'category {category} does not exist')
+    values['category'] = category
+
+    return values
+
+
+def insert_batch(batch):
+    """Inserts [(index, values)] in one transaction and returns the new ids in the same order."""
+    session = db.session()
+    rows = [values for _, values in batch]
+    statement = insert(Question).returning(Question.id, sort_by_parameter_order=True)
+    ids = session.scalars(statement, rows).all()
+
+    # Bulk inserts skip the ORM events, so publish the changes directly.
+    for question_id, values in zip(ids, rows):
+        record(session, INSERT, question_id, values['category'], values['question'])
+    session.commit()
+    return ids
+
+
+def import_questions(batch_size=None):
+    """Imports the questions of the request body and returns one result per record."""
+    batch_size = batch_size or current_app.config.get('BULK_INSERT_BATCH_SIZE', BATCH_SIZE)
+    categories = get_registry().categories()
+    results = []
+    batch = []
+
+    def flush():
+        try:
+            ids = insert_batch(batch)
+        except Exception:
+            logger.exception('could not insert a batch of %d questions', len(batch))
+            db.session.rollback()
+            results.extend({'index': index, 'error': 'could not be inserted'} for index, _ in batch)
+        else:
+            results.extend({'index': index, 'created': question_id} for (index, _), question_id in zip(batch, ids))
+        batch.clear()
+
+    for index, item in enumerate(read_records()):
+        try:
+            batch.append((index, validate(item, categories)))
+        except InvalidRecord as e:
+            results.append({'index': index, 'error': str(e)})
+            continue
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    results.sort(key=lambda result: result['index'])
+    return results
+
+
+def delete_questions(ids=None, category=None, difficulty=None):
+    """
+    Deletes the questions matching every given criterion in one statement
+    and returns their ids. At least one criterion is required.
+    """
+    criteria = []
+    if ids is not None:
+        if not isinstance(ids, list):
+            raise InvalidRecord('ids must be a list of question ids')
+        criteria.append(Question.id.in_([int(question_id) for question_id in ids]))
+    if category is not None:
+        criteria.append(Question.category == int(category))
+    if difficulty is not None:
+        criteria.append(Question.difficulty == int(difficulty))
+    if not criteria:
+        raise InvalidRecord('ids, category or difficulty is required')
+
+    session = db.session()
+    statement = (
+        delete(Question)
+        .where(*criteria)
+        .returning(Question.id, Question.category)
+        .execution_options(synchronize_session=False)
+    )
+    deleted = session.execute(statement).all()
+
+    # A set-based DELETE skips the ORM events, so publish the changes directly.
+    for question_id, question_category in deleted:
+        record(session, DELETE, question_id, question_category)
+    session.commit()
+    return sorted(question_id for question_id, _ in deleted)
@@ -0,0 +1,93 @@
+"""
+In-process category registry.
+
+Categories are read by almost every endpoint but practically never change,
+so the {id: type} mapping is kept in memory instead of being queried on
+each request. The registry is dropped whenever a transaction that wrote a
+Category commits, and reloaded when a request under @conditional
+(flaskr.versions) has read a newer version of the categories table, so
+that writes made by other processes are picked up too. Elsewhere it is
+reloaded at most every CATEGORIES_CACHE_TTL seconds.
+"""
+
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import Category
+from .versions import CATEGORIES, current_versions, is_newer
+
+DEFAULT_TTL = 300
+
+
+class CategoryRegistry:
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._categories = None
+        self._loaded_at = 0
+        # The version of the categories table the mapping was loaded at, when known.
+        self._table_version = None
+
+    def _expired(self, version):
+        if self._categories is None or is_newer(version, self._table_version):
+            return True
+        return time.monotonic() - self._loaded_at > self.ttl
+
+    def _load(self, version):
+        self._categories = {category.id: category.type for category in Category.query.order_by(Category.id).all()}
+        self._loaded_at = time.monotonic()
+        self._table_version = version
+
+    def categories(self):
+        """Returns the {id: type} mapping, loading it if needed."""
+        version = current_versions().get(CATEGORIES)
+        with self._lock:
+            if self._expired(version):
+                self._load(version)
+            return self._categories
+
+    def invalidate(self):
+        with self._lock:
+            self._categories = None
+
+
+def init_app(app):
+    ttl = app.config.get('CATEGORIES_CACHE_TTL', DEFAULT_TTL)
+    app.extensions['category_registry'] = CategoryRegistry(ttl=ttl)
+
+
+def get_registry():
+    return current_app.extensions['category_registry']
+
+
+"""
+Invalidation hooks: remember that the session wrote a category and drop the
+registry once (and only if) that transaction commits. The cached listings
+that embed it are keyed by the table versions, which the commit bumps.
+"""
+
+
+def _mark_categories_dirty(mapper, connection, target):
+    Session.object_session(target).info['categories_dirty'] = True
+
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Category, _event_name, _mark_categories_dirty)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('categories_dirty', False) and has_app_context():
+        registry = current_app.extensions.get('category_registry')
+        if registry is not None:
+            registry.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_after_rollback(session):
+    session.info.pop('categories_dirty', None)
@@ -0,0 +1,72 @@
+"""
+Question change feed.
+
+Several in-memory structures are derived from the questions table (counts,
+the search index, the quiz id index). They follow writes through this
+module: changes are collected per session, from the Question mapper events
+or from bulk statements through record(), and handed to every subscriber
+once the transaction commits. They are dropped if it rolls back.
+"""
+
+from collections import namedtuple
+
+from flask import has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import Question
+
+INSERT = 'insert'
+UPDATE = 'update'
+DELETE = 'delete'
+
+# kind is INSERT, UPDATE or DELETE. For an UPDATE, previous_category is the
+# category before the change (equal to category when it did not change).
+QuestionChange = namedtuple('QuestionChange', 'kind id category question previous_category')
+
+_subscribers = []
+
+
+def subscribe(callback):
+    """Registers callback(changes) to be called, in an app context, after each commit that wrote questions."""
+    _subscribers.append(callback)
+    return callback
+
+
+def record(session, kind, question_id, category, question=None, previous_category=None):
+    """Records a change to publish when session commits (for bulk writes that bypass the ORM events)."""
+    if previous_category is None:
+        previous_category = category
+    change = QuestionChange(kind, question_id, category, question, previous_category)
+    session.info.setdefault('question_changes', []).append(change)
+
+
+@event.listens_for(Question, 'after_insert')
+def _record_insert(mapper, connection, target):
+    record(Session.object_session(target), INSERT, target.id, target.category, target.question)
+
+
+@event.listens_for(Question, 'after_update')
+def _record_update(mapper, connection, target):
+    history = inspect(target).attrs.category.history
+    previous_category = history.deleted[0] if history.deleted else target.category
+    record(Session.object_session(target), UPDATE, target.id, target.category, target.question, previous_category)
+
+
+@event.listens_for(Question, 'after_delete')
+def _record_delete(mapper, connection, target):
+    record(Session.object_session(target), DELETE, target.id, target.category)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_after_commit(session):
+    changes = session.info.pop('question_changes', None)
+    if not changes or not has_app_context():
+        return
+    for callback in _subscribers:
+        callback(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_after_rollback(session):
+    session.info.pop('question_changes', None)
@@ -0,0 +1,133 @@
+"""
+Question counts for the listing endpoints.
+
+`total_questions` used to cost a COUNT(*) on every request. The counts are
+now loaded once with a single GROUP BY, kept up to date in memory from the
+question change feed (flaskr.changes), and reloaded from the database
+when a request under @conditional (flaskr.versions) has read a newer
+version of the questions table, to pick up writes made by other
+processes. Elsewhere they are reloaded every QUESTION_COUNTS_TTL seconds.
+
+With QUESTION_COUNTS_MODE = 'estimate' the counts come from the Postgres
+planner instead (pg_class.reltuples for the whole table, the EXPLAIN row
+estimate for a category), which never scans the table and is meant for
+very large question banks where an approximate total is good enough.
+"""
+
+import json
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import func, select, text
+
+from models import db, Question
+from .changes import DELETE, INSERT, UPDATE, subscribe
+from .versions import QUESTIONS, current_versions, is_newer
+
+DEFAULT_TTL = 60
+MODES = ('cached', 'estimate')
+
+
+class QuestionCounts:
+
+    def __init__(self, mode='cached', ttl=DEFAULT_TTL):
+        if mode not in MODES:
+            raise ValueError(f'QUESTION_COUNTS_MODE must be one of {MODES}, got {mode!r}')
+        self.mode = mode
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._by_category = None
+        self._loaded_at = 0
+        # The version of the questions table the counts were loaded at, when known.
+        self._table_version = None
+
+    def refresh(self, version=None):
+        """Reloads the exact counts from the database."""
+        rows = db.session.query(Question.category, func.count(Question.id)).group_by(Question.category).all()
+        by_category = dict(rows)
+        with self._lock:
+            self._by_category = by_category
+            self._loaded_at = time.monotonic()
+            self._table_version = version
+
+    def _counts(self):
+        version = current_versions().get(QUESTIONS)
+        if (self._by_category is None or is_newer(version, self._table_version)
+                or time.monotonic() - self._loaded_at > self.ttl):
+            self.refresh(version)
+        return self._by_category
+
+    def total(self):
+        if self._use_estimates():
+            return self._estimate_total()
+        return sum(self._counts().values())
+
+    def category(self, category_id):
+        if self._use_estimates():
+            return self._estimate_category(category_id)
+        return self._counts().get(category_id, 0)
+
+    def apply(self, deltas):
+        """Adds {category: delta} to the cached counts, if they are loaded."""
+        with self._lock:
+            if self._by_category is None:
+                return
+            for category, delta in deltas.items():
+                count = self._by_category.get(category, 0) + delta
+                if count > 0:
+                    self._by_category[category] = count
+                else:
+                    self._by_category.pop(category, None)
+
+    def invalidate(self):
+        with self._lock:
+            self._by_category = None
+
+    # Planner estimates, Postgres only. Other databases get exact counts.
+
+    def _use_estimates(self):
+        return self.mode == 'estimate' and db.engine.dialect.name == 'postgresql'
+
+    def _estimate_total(self):
+        estimate = db.session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = 'questions'::regclass")
+        ).scalar()
+        # reltuples is -1 (or 0) until the table has been analyzed.
+        if estimate is None or estimate <= 0:
+            return sum(self._counts().values())
+        return estimate
+
+    def _estimate_category(self, category_id):
+        statement = select(Question.id).where(Question.category == category_id)
+        sql = str(statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+        plan = db.session.execute(text(f'EXPLAIN (FORMAT JSON) {sql}')).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+def init_app(app):
+    mode = app.config.get('QUESTION_COUNTS_MODE', 'cached')
+    ttl = app.config.get('QUESTION_COUNTS_TTL', DEFAULT_TTL)
+    app.extensions['question_counts'] = QuestionCounts(mode=mode, ttl=ttl)
+
+
+def get_counts():
+    return current_app.extensions['question_counts']
+
+
+@subscribe
+def _apply_changes(changes):
+    counts = current_app.extensions.get('question_counts')
+    if counts is None:
+        return
+    deltas = {}
+    for change in changes:
+        if change.kind == UPDATE and change.previous_category == change.category:
+            continue
+        if change.kind in (UPDATE, DELETE):
+            deltas[change.previous_category] = deltas.get(change.previous_category, 0) - 1
+        if change.kind in (INSERT, UPDATE):
+            deltas[change.category] = deltas.get(change.category, 0) + 1
+    counts.apply(deltas)
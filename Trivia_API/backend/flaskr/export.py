@@ -0,0 +1,65 @@
+"""
+Streaming export of the question bank for `GET /questions/export`.
+
+Rows are read through a server-side cursor EXPORT_BATCH_SIZE at a time as
+plain tuples (no ORM objects, see flaskr.rows) and written to the response
+as they arrive, so memory use does not depend on the size of the table.
+NDJSON lines are serialized by the app's JSON provider, straight to bytes.
+"""
+
+import csv
+import io
+
+from flask import Response, current_app, stream_with_context
+
+from models import db, Question
+from .rows import COLUMNS, format_row, select_questions
+
+BATCH_SIZE = 1000
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def iter_rows(batch_size):
+    """Yields lists of up to batch_size question rows, in id order."""
+    statement = select_questions().order_by(Question.id)
+    result = db.session.execute(statement.execution_options(stream_results=True, yield_per=batch_size))
+    for partition in result.partitions():
+        yield partition
+
+
+def ndjson_chunks(batch_size):
+    dumpb = current_app.json.dumpb
+    for rows in iter_rows(batch_size):
+        yield b''.join(dumpb(format_row(row), newline=True) for row in rows)
+
+
+def csv_chunks(batch_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(COLUMNS)
+    for rows in iter_rows(batch_size):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_response(format):
+    """Returns a streamed Response with the whole question bank, raising ValueError for an unknown format."""
+    if format not in FORMATS:
+        raise ValueError(f'format must be one of {tuple(FORMATS)}, got {format!r}')
+    batch_size = current_app.config.get('EXPORT_BATCH_SIZE', BATCH_SIZE)
+    chunks = ndjson_chunks(batch_size) if format == 'ndjson' else csv_chunks(batch_size)
+
+    return Response(
+        stream_with_context(chunks),
+        mimetype=FORMATS[format],
+        headers={'Content-Disposition': f'attachment; filename=questions.{format}'}
+    )
@@ -0,0 +1,75 @@
+"""
+JSON provider.
+
+Every response goes through app.json. With JSON_PROVIDER = 'orjson' (the
+default when the `orjson` package is installed) it serializes with orjson,
+several times faster than the standard library on question pages, and
+writes the response body as bytes without an intermediate str. 'stdlib'
+keeps Flask's default provider.
+
+The output parses to the same JSON: integer keys (the categories mapping)
+become strings and dates still use the HTTP date format of Flask's
+provider. Keys are sorted too, but orjson sorts integer keys once they are
+strings ("1", "10", "2") where the standard library sorts the integers
+(1, 2, 10), so the bytes of such objects differ between the providers.
+Calls with extra arguments (e.g. indent=2) and the pretty-printed responses
+of debug mode fall back to the standard library.
+"""
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+PROVIDERS = ('orjson', 'stdlib')
+
+
+class OrjsonProvider(DefaultJSONProvider):
+
+    def _option(self):
+        # Dates are passed to self.default so they keep Flask's format.
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._option()).decode('utf-8')
+
+    def dumpb(self, obj, newline=False):
+        """Serializes obj to UTF-8 bytes, optionally followed by a newline (for NDJSON)."""
+        option = self._option()
+        if newline:
+            option |= orjson.OPT_APPEND_NEWLINE
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumpb(obj, newline=True), mimetype=self.mimetype)
+
+
+class StdlibProvider(DefaultJSONProvider):
+
+    def dumpb(self, obj, newline=False):
+        text = self.dumps(obj, separators=(',', ':'))
+        return (text + '\n' if newline else text).encode('utf-8')
+
+
+def init_app(app):
+    provider = app.config.get('JSON_PROVIDER') or ('orjson' if orjson is not None else 'stdlib')
+    if provider not in PROVIDERS:
+        raise ValueError(f'JSON_PROVIDER must be one of {PROVIDERS}, got {provider!r}')
+    if provider == 'orjson' and orjson is None:
+        raise ValueError("JSON_PROVIDER is 'orjson' but the orjson package is not installed")
+    app.json = OrjsonProvider(app) if provider == 'orjson' else StdlibProvider(app)
@@ -0,0 +1,309 @@
+"""
+Prometheus metrics for `GET /metrics`.
+
+Per route (the Flask endpoint, e.g. get_questions or play_quiz):
+
+- trivia_http_requests_total{route, method, status}
+- trivia_http_request_duration_seconds{route}, a histogram
+- trivia_sql_queries_total{route}, from flaskr.timing
+- trivia_slow_queries_total{route}, from flaskr.slow_queries
+
+and, for the process, trivia_cache_requests_total{cache, result} (the
+response cache and the conditional GETs) and the connection pool gauges
+trivia_db_pool_connections{pool, state}.
+
+Updates take no lock: each thread adds to its own dict of values, and the
+dicts are only summed when the metrics are exported, so keeping them on
+costs a few dict updates per request. When a thread exits, its values are
+added to those of the threads gone before, so the number of dicts stays
+that of the live threads.
+
+With several worker processes (gunicorn), set METRICS_MULTIPROC_DIR (in
+the config or the environment) to a directory shared by the workers and
+emptied at startup. Each worker then writes its values there, at most
+every METRICS_FLUSH_INTERVAL seconds (default 1) and whenever it is
+scraped, and `GET /metrics`, whichever worker answers it, adds up the
+files of all of them. The counters of workers that exit are kept (see
+gunicorn.conf.py); their gauges are dropped.
+
+In async mode (flaskr.async_app) the async app counts its requests in the
+registry of the Flask app it is served with, so `GET /metrics` covers both.
+
+Set METRICS to False to turn the metrics off.
+"""
+
+import json
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+
+from flask import current_app, request
+
+from .pool import pools
+from .timing import get_timing
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_FLUSH_INTERVAL = 1
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ARCHIVE = 'archive.json'
+
+# name -> (type, help)
+METRICS = {
+    'trivia_http_requests_total': ('counter', 'Requests handled, by route, method and status code.'),
+    'trivia_http_request_duration_seconds': ('histogram', 'Time spent handling requests, by route.'),
+    'trivia_sql_queries_total': ('counter', 'SQL statements run by requests, by route.'),
+    'trivia_slow_queries_total': ('counter', 'SQL statements slower than SLOW_QUERY_MS, by route.'),
+    'trivia_cache_requests_total': ('counter', 'Cache lookups, by cache and result (hit or miss).'),
+    'trivia_db_pool_connections': ('gauge', 'Database connections, by pool and state.'),
+}
+
+
+class _Shard:
+    """The values of one thread; finalized when the thread exits."""
+
+    __slots__ = ('values', '__weakref__')
+
+    def __init__(self):
+        self.values = {}
+
+
+class Registry:
+    """
+    Counters and histograms of the process. Values are keyed by
+    (sample name, sorted label pairs); histogram buckets are stored
+    non-cumulative and made cumulative when exported.
+    """
+
+    def __init__(self, directory=None, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        # Where, and how often, record_request writes the values in multi-process mode.
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._flushed_at = 0.0
+        self._local = threading.local()
+        # The values of the live threads, and the sum of those of the exited ones.
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard.values)
+            # The thread-local holder is dropped when the thread exits.
+            weakref.finalize(shard, self._retire, shard.values)
+        return shard.values
+
+    def _retire(self, values):
+        with self._lock:
+            self._shards = [shard for shard in self._shards if shard is not values]
+            _add(self._retired, values)
+
+    def inc(self, name, amount=1, **labels):
+        shard = self._shard()
+        key = (name, tuple(sorted(labels.items())))
+        shard[key] = shard.get(key, 0) + amount
+
+    def observe(self, name, value, buckets=DURATION_BUCKETS, **labels):
+        shard = self._shard()
+        labels = tuple(sorted(labels.items()))
+        index = bisect_left(buckets, value)
+        le = str(buckets[index]) if index < len(buckets) else '+Inf'
+        for key, amount in (
+            ((f'{name}_bucket', labels + (('le', le),)), 1),
+            ((f'{name}_sum', labels), value),
+            ((f'{name}_count', labels), 1),
+        ):
+            shard[key] = shard.get(key, 0) + amount
+
+    def values(self):
+        """{(sample name, labels): value}, summed over the threads."""
+        with self._lock:
+            shards = list(self._shards)
+            total = dict(self._retired)
+        for shard in shards:
+            for key, value in dict(shard).items():
+                total[key] = total.get(key, 0) + value
+        return total
+
+
+def pool_gauges():
+    """{(sample name, labels): connections} of the pools of this process."""
+    gauges = {}
+    for name, status in pools().items():
+        for state in ('checked_out', 'idle', 'overflow'):
+            if state in status:
+                gauges[('trivia_db_pool_connections', (('pool', name), ('state', state)))] = status[state]
+    return gauges
+
+
+def _dump(values):
+    return [[name, [list(pair) for pair in labels], value] for (name, labels), value in values.items()]
+
+
+def _load(items):
+    return {(name, tuple(tuple(pair) for pair in labels)): value for name, labels, value in items}
+
+
+def _add(total, values):
+    for key, value in values.items():
+        total[key] = total.get(key, 0) + value
+
+
+def _write(path, data):
+    temporary = f'{path}.{threading.get_ident()}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # A worker that exited in the meantime.
+        return {}
+
+
+def flush(directory, registry):
+    """Writes the values of this process to its file in the shared directory."""
+    _write(os.path.join(directory, f'metrics_{os.getpid()}.json'), {
+        'counters': _dump(registry.values()),
+        'gauges': _dump(pool_gauges()),
+    })
+
+
+def collect(directory):
+    """The values of every worker that wrote to the directory, added up."""
+    total = {}
+    for filename in os.listdir(directory):
+        if filename == ARCHIVE or (filename.startswith('metrics_') and filename.endswith('.json')):
+            data = _read(os.path.join(directory, filename))
+            _add(total, _load(data.get('counters', [])))
+            _add(total, _load(data.get('gauges', [])))
+    return total
+
+
+def mark_process_dead(directory, pid):
+    """Moves the counters of an exited worker to the archive and forgets its gauges."""
+    path = os.path.join(directory, f'metrics_{pid}.json')
+    if not os.path.exists(path):
+        return
+    archive = _load(_read(os.path.join(directory, ARCHIVE)).get('counters', []))
+    _add(archive, _load(_read(path).get('counters', [])))
+    _write(os.path.join(directory, ARCHIVE), {'counters': _dump(archive)})
+    os.remove(path)
+
+
+def render(values):
+    """The values in the Prometheus text exposition format."""
+    samples = {}
+    for (name, labels), value in values.items():
+        family = next((metric for metric in METRICS if name == metric or name.startswith(f'{metric}_')), name)
+        samples.setdefault(family, []).append((name, labels, value))
+
+    lines = []
+    for family in sorted(samples):
+        kind, description = METRICS.get(family, ('untyped', ''))
+        lines.append(f'# HELP {family} {description}')
+        lines.append(f'# TYPE {family} {kind}')
+        family_samples = samples[family]
+        if kind == 'histogram':
+            family_samples = _cumulative(family, family_samples)
+        for name, labels, value in sorted(family_samples, key=_sample_order):
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _cumulative(family, samples):
+    """The histogram samples with every bucket counting the observations up to its bound, plus +Inf."""
+    bounds = [str(bound) for bound in DURATION_BUCKETS] + ['+Inf']
+    buckets, others = {}, []
+    for name, labels, value in samples:
+        if name == f'{family}_bucket':
+            series = tuple(pair for pair in labels if pair[0] != 'le')
+            buckets.setdefault(series, {})[dict(labels)['le']] = value
+        else:
+            others.append((name, labels, value))
+    for series, counts in buckets.items():
+        running = 0
+        for bound in bounds:
+            running += counts.get(bound, 0)
+            others.append((f'{family}_bucket', series + (('le', bound),), running))
+    return others
+
+
+def _sample_order(sample):
+    name, labels, _ = sample
+    le = dict(labels).get('le')
+    bound = float(le) if le is not None else 0
+    return name, tuple(pair for pair in labels if pair[0] != 'le'), bound
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def init_app(app):
+    if not app.config.get('METRICS', True):
+        return
+    directory = app.config.get('METRICS_MULTIPROC_DIR', os.getenv('METRICS_MULTIPROC_DIR'))
+    app.config['METRICS_MULTIPROC_DIR'] = directory
+    interval = float(app.config.get('METRICS_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL))
+    registry = Registry(directory=directory, flush_interval=interval)
+    app.extensions['metrics'] = registry
+
+    @app.after_request
+    def count_request(response):
+        record_request(registry, request, response, get_timing())
+        return response
+
+
+def record_request(registry, req, response, timing=None):
+    """Counts a response of the Flask or the async app, and writes the values out in multi-process mode."""
+    route = req.endpoint or 'unmatched'
+    registry.inc('trivia_http_requests_total', route=route, method=req.method, status=response.status_code)
+    if timing is not None:
+        registry.observe('trivia_http_request_duration_seconds', timing.elapsed, route=route)
+        registry.inc('trivia_sql_queries_total', timing.queries, route=route)
+
+    if registry.directory and time.monotonic() - registry._flushed_at >= registry.flush_interval:
+        registry._flushed_at = time.monotonic()
+        flush(registry.directory, registry)
+
+
+def get_metrics():
+    """The Registry of the app, or None when metrics are off."""
+    return current_app.extensions.get('metrics')
+
+
+def count_cache(cache, hit):
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.inc('trivia_cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+
+def export():
+    """The metrics of the app, of every worker in multi-process mode, as Prometheus text."""
+    registry = get_metrics()
+    directory = current_app.config.get('METRICS_MULTIPROC_DIR')
+    if directory:
+        flush(directory, registry)
+        return render(collect(directory))
+    values = registry.values()
+    values.update(pool_gauges())
+    return render(values)
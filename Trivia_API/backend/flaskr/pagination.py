@@ -0,0 +1,148 @@
+"""
+Shared pagination for the question listings.
+
+Every listing reads `page` and `per_page` from the query string the same
+way and lets the database do the slicing with LIMIT/OFFSET plus a separate
+COUNT query, so only the rows of the requested page are ever loaded.
+
+Passing `after` and/or `limit` instead switches to cursor (keyset) mode:
+each page continues after the last question id of the previous one, so
+every page is an index range scan no matter how deep it is, and no COUNT
+is run (the total is only returned when it comes from flaskr.counts). The
+cursor is opaque to clients and returned as `next_cursor`.
+"""
+
+import base64
+from bisect import bisect_right
+
+from flask import current_app, request
+
+from models import db, Question
+from .rows import select_questions
+
+QUESTIONS_PER_PAGE = 8
+MAX_QUESTIONS_PER_PAGE = 100
+
+
+def page_args(args, config):
+    """Returns (page, per_page) from query arguments, clamped to sane values."""
+    default_per_page = config.get('QUESTIONS_PER_PAGE', QUESTIONS_PER_PAGE)
+    max_per_page = config.get('MAX_QUESTIONS_PER_PAGE', MAX_QUESTIONS_PER_PAGE)
+
+    page = args.get('page', 1, type=int)
+    per_page = args.get('per_page', default_per_page, type=int)
+
+    page = max(page, 1)
+    per_page = min(max(per_page, 1), max_per_page)
+    return page, per_page
+
+
+def get_page_args():
+    """Returns (page, per_page) from the query string of the current request."""
+    return page_args(request.args, current_app.config)
+
+
+def encode_cursor(question_id):
+    return base64.urlsafe_b64encode(str(question_id).encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Returns the question id in a cursor, raising ValueError when it is malformed."""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        return int(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f'invalid cursor {cursor!r}') from e
+
+
+def is_cursor_request(args=None):
+    args = request.args if args is None else args
+    return 'after' in args or 'limit' in args
+
+
+def cursor_args(args, config):
+    """Returns (after, limit) from query arguments, after being None on the first page."""
+    _, per_page = page_args(args, config)
+    max_per_page = config.get('MAX_QUESTIONS_PER_PAGE', MAX_QUESTIONS_PER_PAGE)
+    limit = args.get('limit', per_page, type=int)
+    return args.get('after') or None, min(max(limit, 1), max_per_page)
+
+
+def get_cursor_args():
+    """Returns (after, limit) from the query string of the current request."""
+    return cursor_args(request.args, current_app.config)
+
+
+class Page:
+    """A page of questions, shaped like a Flask-SQLAlchemy Pagination."""
+
+    def __init__(self, items, total=None):
+        self.items = items
+        self.total = total
+        self.next_cursor = None
+
+
+class KeysetPage(Page):
+    """A page of questions in cursor mode."""
+
+    def __init__(self, items, limit, total=None):
+        super().__init__(items[:limit], total=total)
+        self.has_next = len(items) > limit
+        if self.has_next:
+            self.next_cursor = encode_cursor(self.items[-1].id)
+
+
+def keyset_paginate(query, after=None, limit=None, total=None):
+    """Returns the `limit` questions of query with an id greater than the cursor `after`."""
+    if limit is None:
+        request_after, limit = get_cursor_args()
+        after = after or request_after
+
+    query = query.order_by(None).order_by(Question.id)
+    if after:
+        query = query.filter(Question.id > decode_cursor(after))
+
+    # One extra row tells whether there is a next page without counting.
+    return KeysetPage(query.limit(limit + 1).all(), limit, total=total)
+
+
+def paginate(query, page=None, per_page=None, total=None):
+    """
+    Paginates a Question query in the database.
+    Returns a Flask-SQLAlchemy Pagination with `items` and `total`, or a
+    KeysetPage with `items` and `next_cursor` when the request asks for
+    cursor mode. When the caller already knows `total` (see flaskr.counts)
+    the COUNT query is skipped.
+    """
+    if page is None and per_page is None and is_cursor_request():
+        return keyset_paginate(query, total=total)
+    if page is None or per_page is None:
+        page, per_page = get_page_args()
+    pagination = query.paginate(page=page, per_page=per_page, error_out=False, count=total is None)
+    if total is not None:
+        pagination.total = total
+    pagination.next_cursor = None
+    return pagination
+
+
+def _load_questions(question_ids):
+    if not question_ids:
+        return []
+    statement = select_questions().where(Question.id.in_(question_ids)).order_by(Question.id)
+    return db.session.execute(statement).all()
+
+
+def paginate_ids(question_ids):
+    """
+    Paginates a sorted list of question ids held in memory, in page or
+    cursor mode, loading only the rows (flaskr.rows) of the requested page.
+    """
+    total = len(question_ids)
+    if is_cursor_request():
+        after, limit = get_cursor_args()
+        start = bisect_right(question_ids, decode_cursor(after)) if after else 0
+        return KeysetPage(_load_questions(question_ids[start:start + limit + 1]), limit, total=total)
+
+    page, per_page = get_page_args()
+    start = (page - 1) * per_page
+    return Page(_load_questions(question_ids[start:start + per_page]), total=total)
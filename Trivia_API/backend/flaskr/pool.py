@@ -0,0 +1,35 @@
+"""
+Connection pool metrics for `GET /metrics/pool`.
+
+The pool is sized by the DB_POOL_* settings applied in models.setup_db. The
+numbers below are those of the current process only: with several workers,
+each has its own pool.
+"""
+
+from models import db
+from .replicas import get_router
+
+
+def pool_status(engine):
+    """Returns the size and checked-out/idle/overflow connection counts of the engine's pool."""
+    pool = engine.pool
+    status = {'pool': type(pool).__name__}
+    # Only queue pools (the default outside SQLite in-memory databases) keep these counts.
+    if hasattr(pool, 'checkedout'):
+        status.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+        })
+    return status
+
+
+def pools():
+    """Status of the primary's pool and of every read replica's (with its health)."""
+    status = {'primary': pool_status(db.engine)}
+    router = get_router()
+    if router is not None:
+        for name, health in router.status().items():
+            status[name] = {**pool_status(router.engines[name]), **health}
+    return status
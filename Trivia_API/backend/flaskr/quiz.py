@@ -0,0 +1,218 @@
+"""
+Quiz question selection.
+
+Picking the next quiz question used to load every eligible row and call
+random.choice on the list.
+
+By default the ids of the questions are kept in memory, per category and
+for all categories, in compact sorted `array('i')`s (4 bytes per question).
+The index is built on first use with a single (id, category) query, follows
+writes through the question change feed and is rebuilt every
+QUIZ_ID_INDEX_TTL seconds to pick up writes from other processes: the
+request that finds it expired rebuilds it, while concurrent ones keep
+sampling the current arrays. A quiz step samples an id from it and only
+fetches that one row.
+
+With QUIZ_ID_INDEX = False the sampling is done by id range inside the
+database instead: draw a random pivot between the lowest and highest
+question id and take the first eligible question at or after it, wrapping
+around to the one just before it when the pivot lands past the last
+eligible row.
+Every query is a short walk of the primary key index, so the cost of a
+quiz step does not grow with the size of the question bank.
+
+Ids are not perfectly uniform when there are gaps (a question that follows
+a large gap is picked more often), which is fine for a trivia game.
+"""
+
+import random
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from flask import current_app
+from sqlalchemy import func
+
+from models import db, Question
+from .changes import DELETE, INSERT, subscribe
+from .rows import load_row, question_rows
+
+ALL_CATEGORIES = 0
+DEFAULT_TTL = 300
+
+
+def eligible_questions(category_id=None, previous_questions=None):
+    query = Question.query
+    if category_id:
+        query = query.filter(Question.category == category_id)
+    if previous_questions:
+        query = query.filter(Question.id.notin_(previous_questions))
+    return query
+
+
+def pick_random_question(category_id=None, previous_questions=None):
+    """
+    Returns the row (flaskr.rows) of a random question in the category
+    (0/None for all categories) whose id is not in previous_questions, or
+    None when there is none left.
+    """
+    # Unfiltered min and max, asked separately, are answered from the ends
+    # of the primary key index; filtering or combining them makes SQLite scan.
+    low = db.session.query(func.min(Question.id)).scalar()
+    high = db.session.query(func.max(Question.id)).scalar()
+    if low is None:
+        return None
+
+    pivot = random.randint(low, high)
+    query = question_rows(eligible_questions(category_id, previous_questions))
+
+    question = query.filter(Question.id >= pivot).order_by(Question.id).first()
+    if question is None:
+        question = query.filter(Question.id < pivot).order_by(Question.id.desc()).first()
+    return question
+
+
+class QuestionIdIndex:
+    """Sorted question ids per category, plus ALL_CATEGORIES for every question."""
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._ids = None
+        self._loaded_at = 0
+
+    @property
+    def loaded(self):
+        return self._ids is not None
+
+    def build(self, batch_size=50000):
+        ids = {ALL_CATEGORIES: array('i')}
+        rows = db.session.query(Question.id, Question.category).order_by(Question.id).yield_per(batch_size)
+        for question_id, category in rows:
+            ids[ALL_CATEGORIES].append(question_id)
+            ids.setdefault(category, array('i')).append(question_id)
+        with self._lock:
+            self._ids = ids
+            self._loaded_at = time.monotonic()
+
+    def _expired(self):
+        return time.monotonic() - self._loaded_at > self.ttl
+
+    def _ensure_loaded(self):
+        if self._ids is None:
+            with self._build_lock:
+                if self._ids is None:
+                    self.build()
+        elif self._expired() and self._build_lock.acquire(blocking=False):
+            # One caller rebuilds; the others keep sampling the current arrays meanwhile.
+            try:
+                if self._expired():
+                    self.build()
+            finally:
+                self._build_lock.release()
+
+    def nbytes(self):
+        with self._lock:
+            return sum(ids.itemsize * len(ids) for ids in (self._ids or {}).values())
+
+    def ids(self, category_id=None):
+        """Returns a copy of the sorted ids of the category (all categories for 0/None)."""
+        self._ensure_loaded()
+        with self._lock:
+            return array('i', self._ids.get(category_id or ALL_CATEGORIES, ()))
+
+    def _insert(self, key, question_id):
+        ids = self._ids.setdefault(key, array('i'))
+        if not ids or question_id > ids[-1]:
+            ids.append(question_id)
+            return
+        position = bisect_left(ids, question_id)
+        if position == len(ids) or ids[position] != question_id:
+            ids.insert(position, question_id)
+
+    def _delete(self, key, question_id):
+        ids = self._ids.get(key)
+        if not ids:
+            return
+        position = bisect_left(ids, question_id)
+        if position < len(ids) and ids[position] == question_id:
+            del ids[position]
+
+    def add(self, question_id, category):
+        with self._lock:
+            if self._ids is not None:
+                self._insert(ALL_CATEGORIES, question_id)
+                self._insert(category, question_id)
+
+    def remove(self, question_id, category=None):
+        """Removes the id from ALL_CATEGORIES and its category, or from every category when it is not known."""
+        with self._lock:
+            if self._ids is None:
+                return
+            self._delete(ALL_CATEGORIES, question_id)
+            for key in self._ids if category is None else (category,):
+                self._delete(key, question_id)
+
+    def sample(self, category_id=None, previous_questions=None):
+        """Returns a random id of the category that is not in previous_questions, or None."""
+        self._ensure_loaded()
+        excluded = set(previous_questions or ())
+        with self._lock:
+            ids = self._ids.get(category_id or ALL_CATEGORIES)
+            if not ids:
+                return None
+            # While most ids are still eligible, drawing until one is takes
+            # fewer than two draws on average; otherwise filter the array.
+            if 2 * len(excluded) < len(ids):
+                while True:
+                    question_id = ids[random.randrange(len(ids))]
+                    if question_id not in excluded:
+                        return question_id
+            candidates = [question_id for question_id in ids if question_id not in excluded]
+        return random.choice(candidates) if candidates else None
+
+
+def init_app(app):
+    if app.config.get('QUIZ_ID_INDEX', True):
+        app.extensions['question_id_index'] = QuestionIdIndex(ttl=app.config.get('QUIZ_ID_INDEX_TTL', DEFAULT_TTL))
+
+
+def get_id_index():
+    return current_app.extensions.get('question_id_index')
+
+
+def pick_question(category_id=None, previous_questions=None):
+    """
+    Returns the row (flaskr.rows) of a random question in the category that
+    is not in previous_questions, or None when there is none left. Uses the
+    id index when it is enabled, the database otherwise.
+    """
+    index = get_id_index()
+    if index is None:
+        return pick_random_question(category_id, previous_questions)
+
+    previous_questions = set(previous_questions or ())
+    while True:
+        question_id = index.sample(category_id, previous_questions)
+        if question_id is None:
+            return None
+        question = load_row(question_id)
+        if question is not None:
+            return question
+        # Deleted by another process since the index was built; its category is not known.
+        index.remove(question_id)
+        previous_questions.add(question_id)
+
+
+@subscribe
+def _apply_changes(changes):
+    index = current_app.extensions.get('question_id_index')
+    if index is None or not index.loaded:
+        return
+    for change in changes:
+        if change.kind != INSERT:
+            index.remove(change.id, change.previous_category)
+        if change.kind != DELETE:
+            index.add(change.id, change.category)
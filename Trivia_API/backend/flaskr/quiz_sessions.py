@@ -0,0 +1,187 @@
+"""
+Server-side quiz sessions.
+
+With `POST /quizzes` the client sends every question it already played on
+each step. A quiz session instead keeps, on the server, a shuffled sequence
+of the question ids of the chosen category, drawn once when the session is
+created; each step pops the next id in O(1) and loads that single question.
+
+Sessions live in a pluggable store picked by QUIZ_SESSION_STORE:
+
+- 'memory' (default): an in-process LRU of at most QUIZ_SESSION_MAX_SESSIONS
+  sessions, each expiring QUIZ_SESSION_TTL seconds after its last use.
+  Sessions are local to the process, so use it with a single worker or
+  sticky load balancing.
+- 'redis': a Redis list per session, shared by every worker. Needs the
+  `redis` package and QUIZ_SESSION_REDIS_URL, or any client object with the
+  same list commands passed to RedisSessionStore (e.g. a stub in tests).
+"""
+
+import random
+import secrets
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from flask import current_app
+
+from models import db, Question
+from .quiz import get_id_index
+from .rows import load_row
+
+DEFAULT_TTL = 3600
+DEFAULT_MAX_SESSIONS = 10000
+DEFAULT_MAX_QUESTIONS = 100
+
+
+def new_session_id():
+    return secrets.token_urlsafe(16)
+
+
+class MemorySessionStore:
+
+    def __init__(self, max_sessions=DEFAULT_MAX_SESSIONS, ttl=DEFAULT_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    def _evict(self, now):
+        # Least recently used first, which is also the first to expire.
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session[0] > now and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+
+    def create(self, question_ids):
+        session_id = new_session_id()
+        now = time.monotonic()
+        with self._lock:
+            # [expires at, question ids, position of the next one]
+            self._sessions[session_id] = [now + self.ttl, array('i', question_ids), 0]
+            self._evict(now)
+        return session_id
+
+    def pop_next(self, session_id):
+        """Returns (next question id or None, remaining), raising KeyError for an unknown or expired session."""
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions[session_id]
+            expires_at, question_ids, position = session
+            if expires_at <= now:
+                del self._sessions[session_id]
+                raise KeyError(session_id)
+            self._sessions.move_to_end(session_id)
+            session[0] = now + self.ttl
+            if position == len(question_ids):
+                return None, 0
+            session[2] = position + 1
+            return question_ids[position], len(question_ids) - position - 1
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class RedisSessionStore:
+
+    def __init__(self, client, ttl=DEFAULT_TTL, prefix='trivia:quiz:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _keys(self, session_id):
+        # The marker key tells an exhausted session (empty list, which Redis drops) from an unknown one.
+        return f'{self.prefix}{session_id}', f'{self.prefix}{session_id}:alive'
+
+    def create(self, question_ids):
+        session_id = new_session_id()
+        questions_key, alive_key = self._keys(session_id)
+        pipeline = self.client.pipeline()
+        pipeline.set(alive_key, 1, ex=self.ttl)
+        if question_ids:
+            pipeline.rpush(questions_key, *question_ids)
+            pipeline.expire(questions_key, self.ttl)
+        pipeline.execute()
+        return session_id
+
+    def pop_next(self, session_id):
+        questions_key, alive_key = self._keys(session_id)
+        pipeline = self.client.pipeline()
+        pipeline.expire(alive_key, self.ttl)
+        pipeline.lpop(questions_key)
+        pipeline.llen(questions_key)
+        pipeline.expire(questions_key, self.ttl)
+        alive, question_id, remaining, _ = pipeline.execute()
+        if not alive:
+            raise KeyError(session_id)
+        return (int(question_id) if question_id is not None else None), remaining
+
+    def delete(self, session_id):
+        self.client.delete(*self._keys(session_id))
+
+
+def init_app(app):
+    backend = app.config.get('QUIZ_SESSION_STORE', 'memory')
+    ttl = app.config.get('QUIZ_SESSION_TTL', DEFAULT_TTL)
+    if backend == 'memory':
+        store = MemorySessionStore(
+            max_sessions=app.config.get('QUIZ_SESSION_MAX_SESSIONS', DEFAULT_MAX_SESSIONS),
+            ttl=ttl
+        )
+    elif backend == 'redis':
+        import redis
+        store = RedisSessionStore(redis.Redis.from_url(app.config['QUIZ_SESSION_REDIS_URL']), ttl=ttl)
+    elif hasattr(backend, 'pop_next'):
+        store = backend
+    else:
+        raise ValueError(f"QUIZ_SESSION_STORE must be 'memory', 'redis' or a store, got {backend!r}")
+    app.extensions['quiz_sessions'] = store
+
+
+def get_store():
+    return current_app.extensions['quiz_sessions']
+
+
+def start_session(category_id=None, max_questions=None):
+    """
+    Draws a shuffled sequence of question ids for the category and stores it;
+    returns (session id, length). A max_questions asked by the client is
+    capped by QUIZ_SESSION_MAX_QUESTIONS; raises ValueError below 1.
+    """
+    configured_max = current_app.config.get('QUIZ_SESSION_MAX_QUESTIONS', DEFAULT_MAX_QUESTIONS)
+    if max_questions is None:
+        max_questions = configured_max
+    elif int(max_questions) < 1:
+        raise ValueError(f'max_questions must be at least 1, got {max_questions!r}')
+    else:
+        max_questions = min(int(max_questions), configured_max)
+    index = get_id_index()
+    if index is not None:
+        question_ids = index.ids(category_id)
+    else:
+        query = db.session.query(Question.id)
+        if category_id:
+            query = query.filter(Question.category == category_id)
+        question_ids = [question_id for question_id, in query]
+
+    question_ids = random.sample(question_ids, min(len(question_ids), max_questions))
+    return get_store().create(question_ids), len(question_ids)
+
+
+def next_question(session_id):
+    """
+    Returns (question row or None, remaining) for the next step of the session,
+    raising KeyError for an unknown or expired session. Questions deleted
+    since the session started are skipped.
+    """
+    store = get_store()
+    while True:
+        question_id, remaining = store.pop_next(session_id)
+        if question_id is None:
+            return None, 0
+        question = load_row(question_id)
+        if question is not None:
+            return question, remaining
@@ -0,0 +1,166 @@
+"""
+Read replica routing.
+
+With DATABASE_REPLICA_URIS set, models.setup_db gives every replica an
+engine of its own. The views marked with @read_only (the listings, search,
+the quiz) then run their queries on a replica, picked round-robin for each
+request, through models.RoutingSession; everything else, and every write
+whatever the view, goes to the primary.
+
+Health checks: a replica whose connection fails or drops is taken out of
+the rotation for REPLICA_RETRY_SECONDS (default 30), with a warning on the
+`flaskr.replicas` logger. After that it is pinged with a `SELECT 1` before
+being used again. With no healthy replica, reads go to the primary.
+
+Read-your-writes: replicas lag behind the primary, so a client that has just
+written gets a cookie sending its reads to the primary for the next
+REPLICA_STICKY_SECONDS (default 5).
+"""
+
+import functools
+import itertools
+import logging
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from models import db
+
+logger = logging.getLogger('flaskr.replicas')
+
+DEFAULT_STICKY_SECONDS = 5
+DEFAULT_RETRY_SECONDS = 30
+STICKY_COOKIE = 'trivia_primary_until'
+
+
+class ReplicaRouter:
+
+    def __init__(self, engines, retry_seconds=DEFAULT_RETRY_SECONDS):
+        self.engines = dict(engines)
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._turns = itertools.cycle(self.engines)
+        # replica name -> monotonic time until which the replica is left out
+        self._down_until = {}
+
+    def mark_down(self, name):
+        with self._lock:
+            self._down_until[name] = time.monotonic() + self.retry_seconds
+
+    def is_healthy(self, name):
+        return name not in self._down_until
+
+    def _check(self, name):
+        try:
+            with self.engines[name].connect() as connection:
+                connection.execute(text('SELECT 1'))
+        except Exception:
+            logger.warning('replica %s failed its health check, left out for %s seconds',
+                           name, self.retry_seconds, exc_info=True)
+            self.mark_down(name)
+            return False
+        with self._lock:
+            self._down_until.pop(name, None)
+        return True
+
+    def pick(self):
+        """Returns the engine of the next healthy replica, or None to use the primary."""
+        for _ in range(len(self.engines)):
+            with self._lock:
+                name = next(self._turns)
+                down_until = self._down_until.get(name)
+            if down_until is None:
+                return self.engines[name]
+            if down_until <= time.monotonic() and self._check(name):
+                return self.engines[name]
+        return None
+
+    def status(self):
+        return {name: {'healthy': self.is_healthy(name)} for name in self.engines}
+
+
+def read_only(view):
+    """Marks a view whose queries may run on a read replica."""
+    view.read_only = True
+    return view
+
+
+def init_app(app):
+    engines = app.extensions.get('replica_engines')
+    if not engines:
+        return
+    router = ReplicaRouter(engines, retry_seconds=app.config.get('REPLICA_RETRY_SECONDS', DEFAULT_RETRY_SECONDS))
+    app.extensions['replica_router'] = router
+
+    for name, engine in engines.items():
+        event.listen(engine, 'handle_error', functools.partial(_on_error, router, name))
+
+    app.before_request(_route_request)
+    app.after_request(_stick_to_primary)
+    app.teardown_request(_end_request)
+
+
+def get_router():
+    return current_app.extensions.get('replica_router')
+
+
+def _on_error(router, name, context):
+    # Only a lost connection, or one that could not be opened (no connection
+    # yet), means the replica is down; a query error such as a statement
+    # timeout, also an OperationalError, does not.
+    if context.is_disconnect or context.connection is None:
+        logger.warning('replica %s taken out of the rotation for %s seconds: %s',
+                       name, router.retry_seconds, context.original_exception)
+        router.mark_down(name)
+
+
+def _route_request():
+    view = current_app.view_functions.get(request.endpoint)
+    if not getattr(view, 'read_only', False):
+        return
+    try:
+        sticky = float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        sticky = False
+    if not sticky:
+        db.session.info['replica'] = get_router().pick()
+
+
+def _stick_to_primary(response):
+    if g.pop('wrote', False):
+        seconds = current_app.config.get('REPLICA_STICKY_SECONDS', DEFAULT_STICKY_SECONDS)
+        response.set_cookie(STICKY_COOKIE, str(time.time() + seconds), max_age=seconds, httponly=True)
+    return response
+
+
+def _end_request(exception=None):
+    db.session.info.pop('replica', None)
+
+
+"""
+Write tracking: a request whose transaction committed a flush or an
+INSERT/UPDATE/DELETE statement makes its client stick to the primary.
+"""
+@event.listens_for(Session, 'after_flush')
+def _flushed(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _executed(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _committed(session):
+    if session.info.pop('wrote', False) and has_request_context():
+        g.wrote = True
+
+
+@event.listens_for(Session, 'after_rollback')
+def _rolled_back(session):
+    session.info.pop('wrote', None)
@@ -0,0 +1,146 @@
+"""
+Response cache for the question listings.
+
+`GET /questions?page=N` and `GET /categories/<id>/questions?page=N` return
+the same JSON to every client between two writes. Views decorated with
+@cached keep their 200 responses, keyed by endpoint, URL arguments and
+normalized query arguments, and serve them again without touching the
+database or re-serializing anything.
+
+The keys also hold the versions of the tables the view reads, as read by
+@conditional (flaskr.versions) for the request, which must wrap the view.
+Each commit that writes questions or categories bumps those versions in
+the database, so the older entries stop matching at once, in every worker;
+they are then evicted as space is needed. Views without versions are not
+cached.
+
+Entries live in a store picked by RESPONSE_CACHE:
+
+- 'memory' (default): an in-process LRU bounded to RESPONSE_CACHE_MAX_BYTES
+  of response bodies, whose entries also expire after RESPONSE_CACHE_TTL
+  seconds.
+- 'redis': entries in Redis, shared by every worker, expiring after
+  RESPONSE_CACHE_TTL seconds. Needs the `redis` package and
+  RESPONSE_CACHE_REDIS_URL, or any client with get/set passed to
+  RedisResponseStore.
+- None or False: no caching.
+
+Cached responses carry `Cache-Control: public,
+max-age=RESPONSE_CACHE_MAX_AGE`, so browsers and a CDN can keep them too;
+they revalidate with the ETag that @conditional derives from the same
+versions.
+"""
+
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, make_response, request
+
+from .metrics import count_cache
+from .versions import current_versions, request_key, versions_token
+
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_TTL = 60
+DEFAULT_MAX_AGE = 5
+
+
+class MemoryResponseStore:
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.nbytes = 0
+        self._lock = threading.Lock()
+        # key -> (expires at, body)
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Returns the body, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (time.monotonic() + self.ttl, body)
+            self.nbytes += len(body)
+            while self.nbytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= len(entry[1])
+
+
+class RedisResponseStore:
+
+    def __init__(self, client, ttl=DEFAULT_TTL, prefix='trivia:responses:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(f'{self.prefix}{key}')
+
+    def set(self, key, body):
+        self.client.set(f'{self.prefix}{key}', body, ex=self.ttl)
+
+
+def init_app(app):
+    backend = app.config.get('RESPONSE_CACHE', 'memory')
+    ttl = app.config.get('RESPONSE_CACHE_TTL', DEFAULT_TTL)
+    if not backend:
+        return
+    if backend == 'memory':
+        store = MemoryResponseStore(max_bytes=app.config.get('RESPONSE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES), ttl=ttl)
+    elif backend == 'redis':
+        import redis
+        store = RedisResponseStore(redis.Redis.from_url(app.config['RESPONSE_CACHE_REDIS_URL']), ttl=ttl)
+    elif hasattr(backend, 'get'):
+        store = backend
+    else:
+        raise ValueError(f"RESPONSE_CACHE must be 'memory', 'redis', a store or None, got {backend!r}")
+    app.extensions['response_cache'] = store
+
+
+def get_store():
+    return current_app.extensions.get('response_cache')
+
+
+def cached(view):
+    """Serves the successful responses of a GET view from the response cache."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        store = get_store()
+        versions = current_versions()
+        if store is None or request.method != 'GET' or not versions:
+            return view(*args, **kwargs)
+
+        key = request_key(versions_token(versions))
+        body = store.get(key)
+        count_cache('responses', hit=body is not None)
+        if body is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            store.set(key, response.get_data())
+        else:
+            response = current_app.response_class(body, mimetype='application/json')
+
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config.get('RESPONSE_CACHE_MAX_AGE', DEFAULT_MAX_AGE)
+        return response
+    return wrapper
+
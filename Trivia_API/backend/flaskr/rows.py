@@ -0,0 +1,40 @@
+"""
+Question rows: the read path without ORM objects.
+
+Loading Question instances costs an identity map entry, change tracking and
+attribute instrumentation per row, only for format() to copy five
+attributes into a dict. Selecting the five columns as plain tuples and
+zipping them with their names gives the same dicts for a fraction of the
+CPU and memory.
+
+The read paths (listings, search, the quiz) select rows this way: with
+select_questions() for new statements, or question_rows() for an existing
+Question query, which keeps its filters and ordering and still works with
+flaskr.pagination. The rows are named tuples, so `row.id` works too.
+"""
+
+from sqlalchemy import select
+
+from models import db, Question
+
+COLUMNS = ('id', 'question', 'answer', 'category', 'difficulty')
+
+
+def select_questions():
+    """A SELECT of the question columns, in the order of COLUMNS."""
+    return select(*(getattr(Question, column) for column in COLUMNS))
+
+
+def question_rows(query):
+    """The same Question query, returning rows of the question columns instead of Question instances."""
+    return query.with_entities(*(getattr(Question, column) for column in COLUMNS))
+
+
+def load_row(question_id):
+    """The row of one question, or None."""
+    return db.session.execute(select_questions().where(Question.id == question_id)).first()
+
+
+def format_row(row):
+    """The dict of Question.format() for a row of select_questions()."""
+    return dict(zip(COLUMNS, row))
@@ -0,0 +1,236 @@
+"""
+Question search.
+
+`POST /questions/search` used to run `question ILIKE '%term%'`, which no
+B-tree index can serve, so every search scanned the whole table. The search
+backend is picked by SEARCH_BACKEND:
+
+- 'fulltext' (default on Postgres): matches the words of the term, each one
+  as a prefix, against `to_tsvector('english', question)` using the GIN
+  expression index created in models.py, and orders by ts_rank. Postgres
+  keeps the index up to date on insert and update by itself.
+- 'memory' (default elsewhere, e.g. SQLite test runs): an in-process
+  inverted index from word to question ids, built on first use, kept up
+  to date from the question change feed (flaskr.changes) and rebuilt every
+  SEARCH_INDEX_TTL seconds to pick up writes from other processes.
+- 'like': the original ILIKE substring match, kept for comparison.
+
+The in-memory index also answers `GET /questions/suggest` (search-as-you-type)
+whatever the backend. Like the other in-memory structures it is built on
+first use, or before serving by flaskr.warmup, never by create_app. Its
+words are kept in a sorted array so that all the words starting with a
+prefix are found with one bisection.
+"""
+
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+
+from flask import current_app
+from sqlalchemy import func
+
+from models import db, Question
+from .changes import DELETE, subscribe
+from .pagination import paginate, paginate_ids
+from .rows import question_rows
+
+BACKENDS = ('fulltext', 'memory', 'like')
+DEFAULT_TTL = 300
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+class InvertedIndex:
+    """Maps lower-cased words to the ids of the questions containing them."""
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._loaded_at = 0
+        self._postings = None
+        self._documents = {}
+        self._titles = {}
+        self._sorted_tokens = []
+
+    @property
+    def loaded(self):
+        return self._postings is not None
+
+    def build(self, batch_size=10000):
+        postings = {}
+        documents = {}
+        titles = {}
+        rows = db.session.query(Question.id, Question.question).yield_per(batch_size)
+        for question_id, text in rows:
+            tokens = set(tokenize(text))
+            documents[question_id] = tokens
+            titles[question_id] = text
+            for token in tokens:
+                postings.setdefault(token, set()).add(question_id)
+        with self._lock:
+            self._postings = postings
+            self._documents = documents
+            self._titles = titles
+            self._sorted_tokens = sorted(postings)
+            self._loaded_at = time.monotonic()
+
+    def _expired(self):
+        return time.monotonic() - self._loaded_at > self.ttl
+
+    def _ensure_loaded(self):
+        if not self.loaded:
+            with self._build_lock:
+                if not self.loaded:
+                    self.build()
+        elif self._expired() and self._build_lock.acquire(blocking=False):
+            # One caller rebuilds; the others keep using the current index meanwhile.
+            try:
+                if self._expired():
+                    self.build()
+            finally:
+                self._build_lock.release()
+
+    def add(self, question_id, text):
+        with self._lock:
+            if self._postings is None:
+                return
+            self._remove(question_id)
+            tokens = set(tokenize(text))
+            self._documents[question_id] = tokens
+            self._titles[question_id] = text
+            for token in tokens:
+                if token not in self._postings:
+                    self._postings[token] = set()
+                    insort(self._sorted_tokens, token)
+                self._postings[token].add(question_id)
+
+    def remove(self, question_id):
+        with self._lock:
+            if self._postings is not None:
+                self._remove(question_id)
+
+    def _remove(self, question_id):
+        self._titles.pop(question_id, None)
+        for token in self._documents.pop(question_id, ()):
+            ids = self._postings.get(token)
+            if ids is None:
+                continue
+            ids.discard(question_id)
+            if not ids:
+                del self._postings[token]
+                del self._sorted_tokens[bisect_left(self._sorted_tokens, token)]
+
+    def _tokens_with_prefix(self, prefix):
+        tokens = self._sorted_tokens
+        i = bisect_left(tokens, prefix)
+        while i < len(tokens) and tokens[i].startswith(prefix):
+            yield tokens[i]
+            i += 1
+
+    def search(self, term):
+        """Returns the sorted ids of the questions containing every word of term (as a prefix)."""
+        self._ensure_loaded()
+        words = tokenize(term)
+        with self._lock:
+            if not words:
+                return sorted(self._documents)
+            matches = None
+            for word in words:
+                ids = set()
+                for token in self._tokens_with_prefix(word):
+                    ids |= self._postings[token]
+                matches = ids if matches is None else matches & ids
+                if not matches:
+                    return []
+            return sorted(matches)
+
+    def suggest(self, text, limit=10):
+        """
+        Returns up to `limit` (id, question) pairs for a partially typed
+        text: the last word is completed, the previous ones must match too.
+        """
+        self._ensure_loaded()
+        words = tokenize(text)
+        if not words:
+            return []
+        *complete, partial = words
+        suggestions = []
+        seen = set()
+        with self._lock:
+            for token in self._tokens_with_prefix(partial):
+                for question_id in self._postings[token]:
+                    if question_id in seen:
+                        continue
+                    seen.add(question_id)
+                    document = self._documents[question_id]
+                    if all(any(word_token.startswith(word) for word_token in document) for word in complete):
+                        suggestions.append((question_id, self._titles[question_id]))
+                        if len(suggestions) == limit:
+                            return suggestions
+        return suggestions
+
+
+def init_app(app):
+    backend = app.config.get('SEARCH_BACKEND')
+    if backend is not None and backend not in BACKENDS:
+        raise ValueError(f'SEARCH_BACKEND must be one of {BACKENDS}, got {backend!r}')
+    app.extensions['search_index'] = InvertedIndex(ttl=app.config.get('SEARCH_INDEX_TTL', DEFAULT_TTL))
+
+
+def get_backend():
+    backend = current_app.config.get('SEARCH_BACKEND')
+    if backend is None:
+        backend = 'fulltext' if db.engine.dialect.name == 'postgresql' else 'memory'
+    return backend
+
+
+def get_index():
+    return current_app.extensions['search_index']
+
+
+def to_tsquery_text(term):
+    """'capital of Ita' -> 'capital:* & of:* & ita:*' (only word characters are kept)."""
+    words = tokenize(term)
+    if not words:
+        return None
+    return ' & '.join(f'{word}:*' for word in words)
+
+
+def fulltext_query(term):
+    query_text = to_tsquery_text(term)
+    if query_text is None:
+        return Question.query.order_by(Question.id)
+    vector = func.to_tsvector('english', Question.question)
+    tsquery = func.to_tsquery('english', query_text)
+    return Question.query.filter(vector.op('@@')(tsquery)).order_by(func.ts_rank(vector, tsquery).desc(), Question.id)
+
+
+def like_query(term):
+    return Question.query.filter(Question.question.ilike(f'%{term}%')).order_by(Question.id)
+
+
+def search(term, backend=None):
+    """Returns a page of the rows (flaskr.rows) of the questions matching term, like flaskr.pagination.paginate."""
+    backend = backend or get_backend()
+    if backend == 'memory':
+        return paginate_ids(get_index().search(term))
+    if backend == 'fulltext':
+        return paginate(question_rows(fulltext_query(term)))
+    return paginate(question_rows(like_query(term)))
+
+
+@subscribe
+def _apply_changes(changes):
+    index = current_app.extensions.get('search_index')
+    if index is None or not index.loaded:
+        return
+    for change in changes:
+        if change.kind == DELETE:
+            index.remove(change.id)
+        else:
+            index.add(change.id, change.question)
@@ -0,0 +1,184 @@
+"""
+Slow query log.
+
+Every statement run on the engines of setup_db (the primary and the read
+replicas) that takes longer than SLOW_QUERY_MS milliseconds (default 200,
+None to turn the log off) is logged at WARNING level on the
+`flaskr.slow_queries` logger, as one JSON object with
+
+- the duration, the statement and its bound parameters (cut to
+  SLOW_QUERY_MAX_PARAMETERS characters; set SLOW_QUERY_PARAMETERS to False
+  to leave them out, e.g. when they may hold personal data),
+- the route (Flask endpoint), method and path of the request that ran it,
+- on Postgres, the plan of a SELECT: `EXPLAIN (ANALYZE off)` is run on the
+  same connection right after it, inside a savepoint so a failure cannot
+  abort the transaction; a failure is logged as a warning instead. The
+  same statement is explained at most once per SLOW_QUERY_EXPLAIN_INTERVAL
+  seconds (default 60); set SLOW_QUERY_EXPLAIN to False to never run it.
+
+Records go through a QueueHandler: the request thread only puts them on a
+queue, and a background QueueListener thread writes them to stderr, or to
+SLOW_QUERY_LOG_FILE when set. Slow queries are also counted in the
+trivia_slow_queries_total{route} metric.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+from flask import has_request_context, request
+from sqlalchemy import event
+
+from models import db
+from .metrics import get_metrics
+
+logger = logging.getLogger('flaskr.slow_queries')
+
+DEFAULT_THRESHOLD_MS = 200
+DEFAULT_EXPLAIN_INTERVAL = 60
+DEFAULT_MAX_PARAMETERS = 1000
+# Statements remembered as recently explained.
+MAX_EXPLAINED = 1000
+
+_queue = queue.SimpleQueue()
+_handlers = []
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def _start_listener():
+    global _listener
+    _listener = logging.handlers.QueueListener(_queue, *_handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_listener_after_fork():
+    # The listener thread does not survive a fork (e.g. gunicorn workers of a
+    # preloaded app); without a new one the records would pile up in the queue.
+    if _listener is not None:
+        _start_listener()
+
+
+def setup_logging(log_file=None):
+    """Sends the slow query log, through a queue, to log_file or stderr. Only the first call has an effect."""
+    with _listener_lock:
+        if _listener is not None:
+            return
+        handler = logging.FileHandler(log_file) if log_file else logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+        _handlers.append(handler)
+        logger.addHandler(logging.handlers.QueueHandler(_queue))
+        logger.setLevel(logging.WARNING)
+        logger.propagate = False
+        _start_listener()
+        atexit.register(_stop_listener)
+        os.register_at_fork(after_in_child=_restart_listener_after_fork)
+
+
+class SlowQueryLog:
+
+    def __init__(self, threshold_ms, explain=True, explain_interval=DEFAULT_EXPLAIN_INTERVAL,
+                 parameters=True, max_parameters=DEFAULT_MAX_PARAMETERS):
+        self.threshold = threshold_ms / 1000
+        self.explain = explain
+        self.explain_interval = explain_interval
+        self.parameters = parameters
+        self.max_parameters = max_parameters
+        # statement -> when it was last explained
+        self._explained = {}
+
+    def listen(self, engine):
+        event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
+        event.listen(engine, 'handle_error', self.handle_error)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('slow_query_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['slow_query_start'].pop()
+        if duration < self.threshold:
+            return
+
+        record = {
+            'duration_ms': round(duration * 1000, 2),
+            'statement': statement,
+            'parameters': repr(parameters)[:self.max_parameters] if self.parameters else None,
+            'route': None,
+        }
+        if has_request_context():
+            record.update(route=request.endpoint, method=request.method, path=request.path)
+            metrics = get_metrics()
+            if metrics is not None:
+                metrics.inc('trivia_slow_queries_total', route=request.endpoint or 'unmatched')
+        if not executemany and self._should_explain(conn, statement):
+            record['plan'] = self._explain(conn, statement, parameters)
+
+        logger.warning(json.dumps(record), extra={'slow_query': record})
+
+    def handle_error(self, exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('slow_query_start'):
+            connection.info['slow_query_start'].pop()
+
+    def _should_explain(self, conn, statement):
+        if not self.explain or conn.dialect.name != 'postgresql':
+            return False
+        if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return False
+        now = time.monotonic()
+        if now - self._explained.get(statement, -self.explain_interval) < self.explain_interval:
+            return False
+        if len(self._explained) >= MAX_EXPLAINED:
+            self._explained.clear()
+        self._explained[statement] = now
+        return True
+
+    def _explain(self, conn, statement, parameters):
+        """The plan of the statement, from a new cursor on the same connection, or None."""
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute('SAVEPOINT slow_query_explain')
+            try:
+                cursor.execute(f'EXPLAIN (ANALYZE off) {statement}', parameters)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+            except Exception:
+                cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                plan = None
+                logger.warning('could not explain %s', statement, exc_info=True)
+            cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+            return plan
+        except Exception:
+            logger.warning('could not explain %s', statement, exc_info=True)
+            return None
+        finally:
+            cursor.close()
+
+
+def init_app(app):
+    threshold_ms = app.config.get('SLOW_QUERY_MS', DEFAULT_THRESHOLD_MS)
+    if threshold_ms is None or threshold_ms is False:
+        return
+    setup_logging(app.config.get('SLOW_QUERY_LOG_FILE'))
+
+    log = SlowQueryLog(
+        float(threshold_ms),
+        explain=app.config.get('SLOW_QUERY_EXPLAIN', True),
+        explain_interval=app.config.get('SLOW_QUERY_EXPLAIN_INTERVAL', DEFAULT_EXPLAIN_INTERVAL),
+        parameters=app.config.get('SLOW_QUERY_PARAMETERS', True),
+        max_parameters=app.config.get('SLOW_QUERY_MAX_PARAMETERS', DEFAULT_MAX_PARAMETERS),
+    )
+    with app.app_context():
+        for engine in [db.engine, *app.extensions.get('replica_engines', {}).values()]:
+            log.listen(engine)
+    app.extensions['slow_query_log'] = log
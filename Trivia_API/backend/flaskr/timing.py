@@ -0,0 +1,137 @@
+"""
+Per-request timing and SQL accounting.
+
+Every request records its wall time and, through the cursor events of
+every engine (the primary and the read replicas), the time spent in SQL,
+the number of statements and the rows they returned or changed. These are
+sent back in a Server-Timing header, which the browser's developer tools
+show next to the request:
+
+    Server-Timing: total;dur=12.41, db;dur=3.02, queries;desc="2", rows;desc="10"
+
+and logged, one JSON object per request, at INFO level on the
+`flaskr.requests` logger (also attached to the record as `request_timing`
+for structured handlers).
+
+Rows are those reported by the driver (cursor.rowcount): psycopg2 counts
+the rows of a SELECT, SQLite only those of writes.
+
+The async app (flaskr.async_app) reports its requests the same way.
+
+Set SERVER_TIMING to False to leave the header out, e.g. when the API is
+exposed to clients who should not see it; the log line is still written.
+"""
+
+import json
+import logging
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('flaskr.requests')
+
+
+class RequestTiming:
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db_time = 0.0
+        self.queries = 0
+        self.rows = 0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def record(self, duration, rowcount):
+        self.db_time += duration
+        self.queries += 1
+        if rowcount > 0:
+            self.rows += rowcount
+
+
+def get_timing():
+    """The RequestTiming of the current request, or None outside of a timed request."""
+    if not has_request_context():
+        return None
+    return g.get('timing')
+
+
+def server_timing(timing, total):
+    return (
+        f'total;dur={total * 1000:.2f}, db;dur={timing.db_time * 1000:.2f}, '
+        f'queries;desc="{timing.queries}", rows;desc="{timing.rows}"'
+    )
+
+
+def parse_server_timing(header):
+    """{metric: duration in ms, or its description} of a Server-Timing header."""
+    metrics = {}
+    for metric in header.split(','):
+        name, *params = [part.strip() for part in metric.split(';')]
+        value = None
+        for param in params:
+            key, _, param_value = param.partition('=')
+            if key == 'dur':
+                value = float(param_value)
+            elif key == 'desc' and value is None:
+                value = param_value.strip('"')
+        metrics[name] = value
+    return metrics
+
+
+def init_app(app):
+
+    @app.before_request
+    def start_timing():
+        g.timing = RequestTiming()
+
+    @app.after_request
+    def report_timing(response):
+        timing = get_timing()
+        if timing is not None:
+            report(timing, request, response, app.config)
+        return response
+
+
+def report(timing, req, response, config):
+    """Adds the Server-Timing header to the response and logs the request (of the Flask or the async app)."""
+    total = timing.elapsed
+    if config.get('SERVER_TIMING', True):
+        response.headers['Server-Timing'] = server_timing(timing, total)
+
+    record = {
+        'method': req.method,
+        'path': req.path,
+        'endpoint': req.endpoint,
+        'status': response.status_code,
+        'duration_ms': round(total * 1000, 2),
+        'db_ms': round(timing.db_time * 1000, 2),
+        'queries': timing.queries,
+        'rows': timing.rows,
+    }
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(record), extra={'request_timing': record})
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _end_query(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info['query_start'].pop()
+    # The async app, which has no Flask request, puts its timing on the connection.
+    timing = conn.info.get('timing') or get_timing()
+    if timing is not None:
+        timing.record(time.perf_counter() - start, cursor.rowcount)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _abort_query(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('query_start'):
+        connection.info['query_start'].pop()
@@ -0,0 +1,131 @@
+"""
+Conditional GET for the listings.
+
+Every transaction that writes questions or categories bumps the matching
+row of table_versions (models.TableVersion) before it commits, so the
+version and the time of the last change are shared by every worker and
+follow writes made by bulk statements too.
+
+Views decorated with @conditional(*tables) read those rows with a single
+primary key lookup and derive from them, and from the request's endpoint
+and arguments, a strong ETag and a Last-Modified. A request whose
+If-None-Match (or If-Modified-Since) still matches gets a 304 before the
+view runs, without loading any row.
+
+The versions read are kept for the rest of the request (current_versions):
+the response cache (flaskr.response_cache) keys its entries with them, and
+the category registry and the question counts reload themselves when they
+are older, so the body sent with an ETag is never older than the ETag.
+"""
+
+import functools
+import hashlib
+from datetime import timezone
+from urllib.parse import urlencode
+
+from flask import current_app, g, has_request_context, make_response, request
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+from werkzeug.http import is_resource_modified
+
+from models import db, TableVersion
+from .metrics import count_cache
+
+QUESTIONS = 'questions'
+CATEGORIES = 'categories'
+
+
+def read_versions(tables):
+    """Returns ({table: version}, last modified datetime or None) for the tables."""
+    rows = db.session.execute(
+        select(TableVersion.name, TableVersion.version, TableVersion.updated_at)
+        .where(TableVersion.name.in_(tables))
+    ).all()
+    return versions_of(rows)
+
+
+def versions_of(rows):
+    """({table: version}, last modified datetime or None) of (name, version, updated_at) rows of table_versions."""
+    versions = {name: version for name, version, _ in rows}
+    last_modified = max((updated_at for _, _, updated_at in rows), default=None)
+    if last_modified is not None and last_modified.tzinfo is None:
+        # SQLite keeps CURRENT_TIMESTAMP, in UTC, without a time zone.
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    return versions, last_modified
+
+
+def current_versions():
+    """The {table: version} read by @conditional for the current request, or {} outside of such a view."""
+    if not has_request_context():
+        return {}
+    return g.get('table_versions', {})
+
+
+def versions_token(versions):
+    """'categories=3,questions=7' for {'questions': 7, 'categories': 3}."""
+    return ','.join(f'{table}={version}' for table, version in sorted(versions.items()))
+
+
+def request_key(token, req=None):
+    """'<token>:<endpoint>:<view args>?<query args>', the query arguments sorted and without empty values."""
+    req = req or request
+    view_args = ','.join(f'{name}={value}' for name, value in sorted((req.view_args or {}).items()))
+    query_args = sorted((name, value) for name, value in req.args.items(multi=True) if value != '')
+    return f'{token}:{req.endpoint}:{view_args}?{urlencode(query_args)}'
+
+
+def make_etag(tables, versions, req=None):
+    """The strong ETag of the request (by default the current Flask one) at these versions of the tables."""
+    token = versions_token({table: versions.get(table, 0) for table in tables})
+    return hashlib.sha1(request_key(token, req).encode('utf-8')).hexdigest()
+
+
+def is_newer(version, loaded_version):
+    """Whether a version read for this request is newer than the one a cache was loaded at."""
+    return version is not None and (loaded_version is None or version > loaded_version)
+
+
+def conditional(*tables):
+    """Answers the GET requests of a view with a 304 while the tables it reads have not changed."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+
+            versions, last_modified = read_versions(tables)
+            g.table_versions = {table: versions.get(table, 0) for table in tables}
+            etag = make_etag(tables, versions)
+
+            not_modified = not is_resource_modified(request.environ, etag=etag, last_modified=last_modified)
+            count_cache('conditional', hit=not_modified)
+            if not_modified:
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            return response
+        return wrapper
+    return decorator
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_versions(session):
+    # Flush first, so that the writes still pending are recorded too.
+    session.flush()
+    tables = []
+    if session.info.get('question_changes'):
+        tables.append(QUESTIONS)
+    if session.info.get('categories_dirty'):
+        tables.append(CATEGORIES)
+    if not tables:
+        return
+    session.execute(
+        update(TableVersion)
+        .where(TableVersion.name.in_(tables))
+        .values(version=TableVersion.version + 1, updated_at=db.func.now())
+        .execution_options(synchronize_session=False)
+    )
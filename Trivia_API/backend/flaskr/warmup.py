@@ -0,0 +1,78 @@
+"""
+Warmup of a server process before it takes traffic.
+
+The in-memory structures (category registry, question counts, search index,
+quiz id index) are otherwise built by the first requests that need them,
+which then pay for whole-table reads. warm_up() builds them all up front.
+Under gunicorn with preload_app (see gunicorn.conf.py) it runs once in the
+master process, and the forked workers share the result copy-on-write.
+
+Database connections must not cross a fork: after forking, each worker
+drops the connections it inherited (reset_pools) and opens its own
+(prime_pools), so its first requests don't wait for connection setup.
+"""
+
+import time
+
+from flask import current_app
+
+from models import db
+from .categories import get_registry
+from .counts import get_counts
+from .quiz import get_id_index
+from .search import get_index
+
+
+def _engines():
+    return [db.engine, *current_app.extensions.get('replica_engines', {}).values()]
+
+
+def warm_caches():
+    """Builds the caches derived from the database; returns {name: seconds}."""
+    timings = {}
+    steps = [
+        ('categories', lambda: get_registry().categories()),
+        ('counts', lambda: get_counts().total()),
+        ('search index', lambda: get_index().loaded or get_index().build()),
+    ]
+    if get_id_index() is not None:
+        steps.append(('quiz id index', lambda: get_id_index().loaded or get_id_index().build()))
+
+    for name, step in steps:
+        start = time.perf_counter()
+        step()
+        timings[name] = time.perf_counter() - start
+    db.session.remove()
+    return timings
+
+
+def reset_pools():
+    """Forgets the pooled connections inherited from the parent process, without closing them."""
+    for engine in _engines():
+        engine.dispose(close=False)
+
+
+def prime_pools(connections=None):
+    """Opens `connections` connections per engine (the pool size by default) and returns them to the pool."""
+    for engine in _engines():
+        count = connections or getattr(engine.pool, 'size', lambda: 1)()
+        opened = []
+        try:
+            for _ in range(count):
+                opened.append(engine.connect())
+        finally:
+            for connection in opened:
+                connection.close()
+
+
+def warm_up(app, caches=True, pools=True):
+    """Runs the warmup steps enabled by WARMUP_CACHES and WARMUP_POOL; returns their timings."""
+    timings = {}
+    with app.app_context():
+        if caches and app.config.get('WARMUP_CACHES', True):
+            timings.update(warm_caches())
+        if pools and app.config.get('WARMUP_POOL', True):
+            start = time.perf_counter()
+            prime_pools(app.config.get('WARMUP_POOL_CONNECTIONS'))
+            timings['connection pool'] = time.perf_counter() - start
+    return timings
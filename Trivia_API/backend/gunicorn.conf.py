@@ -0,0 +1,66 @@
+"""
+gunicorn settings for the Trivia API.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+With preload_app the master imports wsgi.py, which creates the app and
+builds its caches, before forking the workers: the work is done once and
+the memory is shared copy-on-write instead of being repeated per worker.
+Each worker then drops the database connections inherited from the master
+and opens its own before it accepts requests.
+
+The workers write their metrics to METRICS_MULTIPROC_DIR (a temporary
+directory unless set), so that `GET /metrics` reports all of them.
+
+Every setting can be overridden from the environment (below) or the
+command line.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 1))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes', 'on')
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# Recycle workers now and then, so a slow leak cannot grow unbounded.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+
+# Read by flaskr.metrics in every worker.
+metrics_dir = os.getenv('METRICS_MULTIPROC_DIR') or tempfile.mkdtemp(prefix='trivia-metrics-')
+os.environ['METRICS_MULTIPROC_DIR'] = metrics_dir
+
+
+def on_starting(server):
+    # Counters start from zero with the server, not with the files of its last run.
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def post_fork(server, worker):
+    from flaskr.warmup import reset_pools
+
+    if preload_app:
+        # The app preloaded by the master, which the worker inherited.
+        with server.app.wsgi().app_context():
+            reset_pools()
+
+
+def post_worker_init(worker):
+    from flaskr.warmup import warm_up
+
+    timings = warm_up(worker.wsgi, caches=False)
+    worker.log.info('worker %s warmed up: %s', worker.pid,
+                    ', '.join(f'{name} {seconds * 1000:.0f} ms' for name, seconds in timings.items()))
+
+
+def child_exit(server, worker):
+    from flaskr.metrics import mark_process_dead
+
+    mark_process_dead(metrics_dir, worker.pid)
@@ -0,0 +1,77 @@
+"""questions.category: integer foreign key to categories, with indexes
+
+Question.category was declared as a String while categories.id is an
+Integer, so filtering questions by category compared text with integers
+and could not use an index. This makes it an integer (converting text
+values created by older versions of the app) referencing categories.id,
+and adds the indexes used by the category listings and the quiz:
+(category, id) and difficulty.
+
+Databases restored from trivia.psql already have a foreign key on
+questions.category, named `category`, with ON DELETE SET NULL (which the
+column can no longer honour once NOT NULL); it is replaced rather than
+duplicated. The questions that foreign key has already left without a
+category (their category was deleted) are deleted first: they are shown
+in no category listing, and NOT NULL would reject them.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 10:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+FOREIGN_KEY = 'fk_questions_category_categories'
+
+
+def upgrade():
+    # Tables created by db.create_all() from the current models already have all of this.
+    inspector = sa.inspect(op.get_bind())
+    category_foreign_keys = {
+        foreign_key['name'] for foreign_key in inspector.get_foreign_keys('questions')
+        if foreign_key['constrained_columns'] == ['category'] and foreign_key['name']
+    }
+    indexes = {index['name'] for index in inspector.get_indexes('questions')}
+
+    op.execute('DELETE FROM questions WHERE category IS NULL')
+
+    with op.batch_alter_table('questions') as batch_op:
+        for name in category_foreign_keys - {FOREIGN_KEY}:
+            batch_op.drop_constraint(name, type_='foreignkey')
+        batch_op.alter_column(
+            'category',
+            existing_type=sa.String(),
+            type_=sa.Integer(),
+            nullable=False,
+            postgresql_using='category::integer'
+        )
+        for column in ('question', 'answer'):
+            batch_op.alter_column(column, existing_type=sa.String(), nullable=False)
+        batch_op.alter_column('difficulty', existing_type=sa.Integer(), nullable=False)
+        if FOREIGN_KEY not in category_foreign_keys:
+            batch_op.create_foreign_key(FOREIGN_KEY, 'categories', ['category'], ['id'])
+
+    if 'ix_questions_category_id' not in indexes:
+        op.create_index('ix_questions_category_id', 'questions', ['category', 'id'])
+    if 'ix_questions_difficulty' not in indexes:
+        op.create_index('ix_questions_difficulty', 'questions', ['difficulty'])
+
+
+def downgrade():
+    op.drop_index('ix_questions_difficulty', table_name='questions')
+    op.drop_index('ix_questions_category_id', table_name='questions')
+
+    with op.batch_alter_table('questions') as batch_op:
+        batch_op.drop_constraint(FOREIGN_KEY, type_='foreignkey')
+        batch_op.alter_column('difficulty', existing_type=sa.Integer(), nullable=True)
+        for column in ('question', 'answer'):
+            batch_op.alter_column(column, existing_type=sa.String(), nullable=True)
+        batch_op.alter_column('category', existing_type=sa.Integer(), nullable=True)
@@ -0,0 +1,33 @@
+"""questions.question: full-text GIN index for search (Postgres only)
+
+Used by the 'fulltext' search backend (flaskr/search.py). Postgres keeps it
+up to date on insert and update; other databases use the in-memory index.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_context().dialect.name != 'postgresql':
+        return
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_questions_question_fts "
+        "ON questions USING gin (to_tsvector('english', question))"
+    )
+
+
+def downgrade():
+    if op.get_context().dialect.name != 'postgresql':
+        return
+    op.execute("DROP INDEX IF EXISTS ix_questions_question_fts")
@@ -0,0 +1,37 @@
+"""table_versions: change counters for the HTTP validators
+
+One row per versioned table, bumped by every transaction that writes it;
+the ETag and Last-Modified of the listings are computed from it.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    table_versions = op.create_table(
+        'table_versions',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(table_versions, [
+        {'name': 'questions', 'version': 0},
+        {'name': 'categories', 'version': 0},
+    ])
+
+
+def downgrade():
+    op.drop_table('table_versions')
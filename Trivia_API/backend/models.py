@@ -1,5 +1,7 @@
-from sqlalchemy import Column, String, Integer
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, ForeignKey, Index, DDL, create_engine, event, func
+from sqlalchemy.engine import make_url
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from dotenv import load_dotenv
 import os
 
@@ -13,27 +15,119 @@ database_host=os.getenv('DATABASE_HOST')
 
 database_path = f'postgresql://{database_user}:{database_password}@{database_host}/{database_name}'
 
-db = SQLAlchemy()
+"""
+RoutingSession
+    sends the reads of a request to the read replica picked for it
+    (session.info['replica'], see flaskr/replicas.py); flushes and
+    INSERT/UPDATE/DELETE statements always go to the primary
+"""
+class RoutingSession(Session):
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get('replica')
+        if replica is not None and bind is None and not self._flushing and not getattr(clause, 'is_dml', False):
+            return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+"""
+Connection pool settings: (config key, engine option, type, default).
+Each one is read from the app config, then from an environment variable of
+the same name. pool_size + max_overflow is the most connections a process
+opens, so keep (workers x that) under the server's max_connections.
+"""
+POOL_SETTINGS = (
+    ('DB_POOL_SIZE', 'pool_size', int, 5),
+    ('DB_MAX_OVERFLOW', 'max_overflow', int, 10),
+    ('DB_POOL_TIMEOUT', 'pool_timeout', float, 30),
+    ('DB_POOL_RECYCLE', 'pool_recycle', int, 1800),
+    ('DB_POOL_PRE_PING', 'pool_pre_ping', bool, True),
+)
+
+
+def _setting(app, name, cast, default):
+    value = app.config.get(name, os.getenv(name))
+    if value is None or value == '':
+        return default
+    if cast is bool and isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return cast(value)
+
+
+def get_statement_timeout(app):
+    """DB_STATEMENT_TIMEOUT in milliseconds, or None."""
+    return _setting(app, 'DB_STATEMENT_TIMEOUT', int, None)
+
+
+"""
+engine_options(app, database_path)
+    SQLALCHEMY_ENGINE_OPTIONS for the pool settings above and, on Postgres,
+    DB_STATEMENT_TIMEOUT (milliseconds) as a server-side statement_timeout
+"""
+def engine_options(app, database_path):
+    url = make_url(database_path)
+    options = {}
+    # SQLite in-memory databases use a single-connection pool without these settings.
+    if url.get_backend_name() != 'sqlite' or url.database not in (None, '', ':memory:'):
+        for name, option, cast, default in POOL_SETTINGS:
+            options[option] = _setting(app, name, cast, default)
+
+    statement_timeout = get_statement_timeout(app)
+    if statement_timeout and url.get_backend_name() == 'postgresql':
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+
+"""
+replica_uris(app)
+    the read replicas, from DATABASE_REPLICA_URIS: a list in the app config
+    or a comma-separated environment variable
+"""
+def replica_uris(app):
+    uris = app.config.get('DATABASE_REPLICA_URIS', os.getenv('DATABASE_REPLICA_URIS'))
+    if not uris:
+        return []
+    if isinstance(uris, str):
+        uris = uris.split(',')
+    return [uri.strip() for uri in uris if uri.strip()]
+
 
 """
 setup_db(app)
-    binds a flask application and a SQLAlchemy service
+    binds a flask application and a SQLAlchemy service; each read replica
+    gets an engine of its own, in app.extensions['replica_engines'] under
+    the names replica-1, replica-2, ...
 """
 def setup_db(app, database_path=database_path):
     app.config['SQLALCHEMY_DATABASE_URI'] = database_path
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Engine options given explicitly win.
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        **engine_options(app, database_path),
+        **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    }
     db.init_app(app)
+    app.extensions['replica_engines'] = {
+        f'replica-{number}': create_engine(uri, **engine_options(app, uri))
+        for number, uri in enumerate(replica_uris(app), start=1)
+    }
 
 """
 Question
 """
 class Question(db.Model):
     __tablename__ = 'questions'
+    __table_args__ = (
+        Index('ix_questions_category_id', 'category', 'id'),
+        Index('ix_questions_difficulty', 'difficulty'),
+    )
 
     id = Column(Integer, primary_key=True)
     question = Column(String, nullable=False)
     answer = Column(String, nullable=False)
-    category = Column(String, nullable=False)
+    category = Column(Integer, ForeignKey('categories.id', name='fk_questions_category_categories'), nullable=False)
     difficulty = Column(Integer, nullable=False)
 
     def __init__(self, question, answer, category, difficulty):
@@ -62,6 +156,22 @@ class Question(db.Model):
             'difficulty': self.difficulty
         }
 
+
+"""
+Full-text search index on the question text (see flaskr/search.py).
+Postgres maintains it on every insert and update. Databases are migrated
+to it by migrations/versions/0003; this hook adds it to the tables made by
+db.create_all() (tests, benchmarks).
+"""
+event.listen(
+    Question.__table__,
+    'after_create',
+    DDL(
+        "CREATE INDEX IF NOT EXISTS ix_questions_question_fts "
+        "ON questions USING gin (to_tsvector('english', question))"
+    ).execute_if(dialect='postgresql')
+)
+
 """
 Category
 """
@@ -74,8 +184,39 @@ class Category(db.Model):
     def __init__(self, type):
         self.type = type
 
+    def insert(self):
+        db.session.add(self)
+        db.session.commit()
+
+    def update(self):
+        db.session.commit()
+
+    def delete(self):
+        db.session.delete(self)
+        db.session.commit()
+
     def format(self):
         return {
             'id': self.id,
             'type': self.type
         }
+
+"""
+TableVersion
+    a change counter and the time of the last change per table ('questions',
+    'categories'), bumped in the transaction of every write (see
+    flaskr/versions.py) and used for the ETag and Last-Modified validators
+"""
+class TableVersion(db.Model):
+    __tablename__ = 'table_versions'
+
+    name = Column(String, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+event.listen(
+    TableVersion.__table__,
+    'after_create',
+    DDL("INSERT INTO table_versions (name, version) VALUES ('questions', 0), ('categories', 0)")
+)
@@ -0,0 +1,15 @@
+"""
+WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is created, and its caches warmed up, when this module is imported:
+once in the gunicorn master with preload_app, or once per worker without.
+Connection pools are primed per worker (see gunicorn.conf.py).
+"""
+
+from flaskr import create_app
+from flaskr.warmup import warm_up
+
+app = create_app()
+warm_up(app, pools=False)